@@ -1,6 +1,10 @@
+from contextlib import contextmanager
 from PyORM.orm import Model
-from PyORM.utils import create_engine
+from PyORM.dialect import get_dialect
 from PyORM.session import Session
+from PyORM.pool import Pool
+from PyORM.replica import ReplicaSet
+from PyORM.shard import ShardSet
 
 
 class PyORM:
@@ -12,8 +16,28 @@ class PyORM:
             host='localhost',
             port=3306,
             autocommit=False,
+            max_batch_rows=1000,
+            max_batch_bytes=1024 * 1024,
+            update_strategy='case',
+            pool=None,
+            check_full_scan=False,
+            dialect='mysql',
+            replicas=None,
+            replica_policy='round_robin',
+            sticky_seconds=5.0,
+            shards=None,
             **kwargs
     ):
+        """
+        :param dialect: 数据库，'mysql'、'sqlite'或Dialect实例；
+                        sqlite时`database`为文件路径，为空时数据库只在内存中，其余连接参数被忽略
+        :param replicas: 只读副本的列表，每项为Pool，或与主库不同的连接参数（如{'host': 'replica-1'}，
+                         也可以包含maxsize等连接池参数）。查询从副本读取，写操作和建表使用主库
+        :param replica_policy: 选择副本的方式，'round_robin'或'least_busy'
+        :param sticky_seconds: 上下文提交写操作后，在这段时间内的查询仍从主库读取
+        :param shards: 分片数据库的列表，格式与`replicas`相同，序号与表单类`shard_map`的分片序号对应。
+                       声明了`shard_map`的表单类只在各分片上建表和读写，其余表单类使用主库
+        """
         self.config = dict()
         self.config['user'] = user
         self.config['password'] = password
@@ -25,21 +49,106 @@ class PyORM:
 
         # self.Model = type('PyORM.Model', Model.__bases__, dict(Model.__dict__))
         self.Model = Model
-        self.session = Session(config=self.config)
+        self.dialect = get_dialect(dialect)
+        if pool is not None and pool.dialect.name != self.dialect.name:
+            raise ValueError(f'the pool connects to {pool.dialect.name}, not {self.dialect.name}')
+        self.replicas = None
+        if replicas:
+            self.replicas = ReplicaSet(
+                [each if isinstance(each, Pool) else Pool(**dict(self.config, **each), dialect=self.dialect)
+                 for each in replicas],
+                policy=replica_policy,
+            )
+        self.shards = None
+        if shards:
+            self.shards = ShardSet([
+                each if isinstance(each, Pool) else Pool(**dict(self.config, **each), dialect=self.dialect)
+                for each in shards
+            ])
+        self.session = Session(
+            config=self.config,
+            max_batch_rows=max_batch_rows,
+            max_batch_bytes=max_batch_bytes,
+            update_strategy=update_strategy,
+            pool=pool,
+            dialect=self.dialect,
+            replicas=self.replicas,
+            sticky_seconds=sticky_seconds,
+            shards=self.shards,
+            check_full_scan=check_full_scan,
+        )
+        self.pool = pool
+
+    def close(self):
+        """
+        关闭当前上下文的连接，以及Session为流式读取、`Query.gather()`自己创建的连接池
+        """
+        self.session.dispose()
+
+    @contextmanager
+    def engine(self):
+        """
+        临时取得一个连接：配置了连接池时从连接池借出并归还，否则新建并关闭
+        """
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                yield conn
+        else:
+            conn = self.dialect.connect(**self.config)
+            try:
+                yield conn
+            finally:
+                conn.close()
 
     def create_all(self):
-        conn = create_engine(**self.config)
-        for cls in self.Model.__subclasses__():
-            cls.create_table(conn)
-        conn.commit()
-        conn.close()
+        for conn, models in self.placement():
+            for cls in models:
+                cls.create_table(conn)
+            conn.commit()
 
     def drop_all(self):
-        conn = create_engine(**self.config)
-        for cls in self.Model.__subclasses__():
-            cls.drop_table(conn)
-        conn.commit()
-        conn.close()
+        for conn, models in self.placement():
+            for cls in reversed(models):
+                cls.drop_table(conn)
+            conn.commit()
+
+    def placement(self):
+        """
+        :return: 生成器，依次产生(连接, 该数据库上的表单类)：主库，以及配置了分片时的每个分片
+        """
+        models = self.models()
+        if self.shards is None:
+            with self.engine() as conn:
+                yield conn, models
+            return
+        with self.engine() as conn:
+            yield conn, [cls for cls in models if cls.__shard_map__ is None]
+        for pool in self.shards.pools:
+            with pool.connection() as conn:
+                yield conn, [cls for cls in models if cls.__shard_map__ is not None]
+
+    def models(self) -> list:
+        """
+        :return: 全部表单类，被外键引用的表单排在引用它的表单之前
+        """
+        classes = self.Model.__subclasses__()
+        by_table = {cls.table_name: cls for cls in classes}
+        ordered, visiting = list(), set()
+
+        def visit(cls):
+            if cls in ordered or cls in visiting:   # a reference cycle is left to the database
+                return
+            visiting.add(cls)
+            for foreign_key in cls.__foreign_keys__:
+                referenced = by_table.get(foreign_key.references[0])
+                if referenced is not None and referenced is not cls:
+                    visit(referenced)
+            visiting.discard(cls)
+            ordered.append(cls)
+
+        for cls in classes:
+            visit(cls)
+        return ordered
 
 
 
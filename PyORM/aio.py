@@ -0,0 +1,348 @@
+import asyncio
+import contextvars
+from functools import partial
+from weakref import WeakKeyDictionary
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from PyORM.pool import Pool
+from PyORM.session import Session
+
+
+class AsyncPool:
+    """
+    asyncio的连接池。连接仍是pymysql、sqlite等同步的连接，每个连接上的操作交给有`maxsize`个线程的线程池执行，
+    事件循环不会被阻塞；同时借出的连接不超过`maxsize`个，其余协程在asyncio.Semaphore上等待，不占用线程
+
+    用法：
+        pool = AsyncPool(user='root', password='123456', database='test_orm', maxsize=10)
+        async with pool.connection() as conn:
+            rows = await pool.run(execute_sql, conn, 'SELECT 1')
+        pool.close()
+    """
+    def __init__(self, maxsize=7, timeout=5, pool=None, **kwargs):
+        """
+        :param timeout: 等待可用连接的秒数，超时抛出`TimeoutError`
+        :param pool: 使用已有的同步连接池（负责创建、ping和回收连接），默认用其余参数新建一个
+        :param kwargs: 同步连接池`Pool`的参数
+        """
+        self.pool = pool if pool is not None else Pool(maxsize=maxsize, timeout=timeout, **kwargs)
+        self.dialect = self.pool.dialect
+        self.maxsize = self.pool.maxsize
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=self.maxsize, thread_name_prefix='PyORM-aio')
+        # created in the running event loop on first use
+        self._semaphore = None
+        self._reserving = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.maxsize)
+        return self._semaphore
+
+    @property
+    def reserving(self) -> asyncio.Lock:
+        """
+        同时需要两个连接的task持有这个锁依次借出，不会两个task各借到一个后互相等待
+        """
+        if self._reserving is None:
+            self._reserving = asyncio.Lock()
+        return self._reserving
+
+    async def run(self, func, *args, **kwargs):
+        """
+        在线程池中执行同步函数
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def acquire_conn(self):
+        """
+        :return: 一个可用的连接，用完后必须`await release_conn()`归还
+        """
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f'no connection available in {self.timeout}s, pool size is {self.maxsize}')
+        future = self.executor.submit(self.pool.acquire_conn)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError as e:
+            # the worker thread may still get a connection after the caller is gone
+            future.add_done_callback(self._release_late)
+            self.semaphore.release()
+            raise e
+        except BaseException as e:
+            self.semaphore.release()
+            raise e
+
+    def _release_late(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self.pool.release_conn(future.result())
+
+    async def release_conn(self, conn):
+        try:
+            await self.run(self.pool.release_conn, conn)
+        finally:
+            self.semaphore.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire_conn()
+        try:
+            yield conn
+        finally:
+            await self.release_conn(conn)
+
+    def close(self):
+        self.pool.close()
+        self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncSession:
+    """
+    asyncio的Session，每个task有独立的连接、提交队列和identity map，task结束时自动归还连接：
+        session = AsyncSession(AsyncPool(...))
+
+        async def handler():
+            students = await session.query(Student).filter_by(age=18)
+            async for student in session.query(Student).filter(Student.age > 18):
+                ...
+            session.add(Student(...))
+            await session.commit()
+
+    查询和提交在同步的Session上执行，它的上下文状态保存在每个task自己的contextvars.Context中。
+    关联属性和延迟加载的字段在访问时才查询数据库，会阻塞事件循环，应使用`load()`和`undefer()`随查询一起加载
+    """
+    def __init__(self, pool: AsyncPool, max_batch_rows=1000, max_batch_bytes=1024 * 1024, update_strategy='case'):
+        self.pool = pool
+        # the synchronous session the work is delegated to, only ever used inside a task's context
+        self.session = Session(
+            config={},
+            max_batch_rows=max_batch_rows,
+            max_batch_bytes=max_batch_bytes,
+            update_strategy=update_strategy,
+            pool=pool.pool,
+            dialect=pool.dialect,
+        )
+        self.tasks = WeakKeyDictionary()     # task -> TaskState
+
+    def query(self, model_class):
+        """
+        :return: 绑定当前Session的AsyncQuery
+        """
+        return AsyncQuery(model_class.query(self.session), self)
+
+    def add(self, records):
+        self._state().context.run(self.session.add, records)
+
+    def upsert(self, records):
+        self._state().context.run(self.session.upsert, records)
+
+    def remove(self, records):
+        self._state().context.run(self.session.remove, records)
+
+    async def commit(self):
+        """
+        与`Session.commit()`相同，在一个事务中执行当前task队列中的全部操作
+        """
+        await self.run(self.session.commit)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        在线程池中、以当前task的连接执行同步函数，`self.session`作为bind时使用这个连接：
+            await session.run(session.session.bulk_load, Student, records)
+            await session.run(Student.bulk_create, session.session, columns)
+        """
+        state = self._state()
+        await self._connect(state)
+        state.pending = self.pool.executor.submit(state.context.run, partial(func, *args, **kwargs))
+        return await asyncio.wrap_future(state.pending)
+
+    async def close(self):
+        """
+        归还当前task的连接并清空它的状态，未提交的操作被丢弃
+        """
+        task = asyncio.current_task()
+        state = self.tasks.pop(task, None)
+        if state is not None:
+            await self._close(state)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _connect(self, state):
+        if state.connection is None:
+            state.connection = await self.pool.acquire_conn()
+            state.context.run(self.session.setitem, 'connect', state.connection)
+
+    async def _stream_connection(self):
+        """
+        :return: 流式读取使用的第二个连接，与task的连接一起借出；
+                 AsyncPool只有一个连接时为task自己的连接，迭代中不能再加载关联和延迟加载的字段
+        """
+        state = self._state()
+        async with self.pool.reserving:
+            await self._connect(state)
+            if self.pool.maxsize < 2:
+                return state.connection
+            return await self.pool.acquire_conn()
+
+    def _state(self):
+        task = asyncio.current_task()
+        if task is None:
+            raise RuntimeError('AsyncSession must be used inside an asyncio task')
+        state = self.tasks.get(task)
+        if state is None:
+            state = self.tasks[task] = TaskState()
+            task.add_done_callback(self._task_done)
+        return state
+
+    def _task_done(self, task):
+        state = self.tasks.pop(task, None)
+        if state is not None and state.connection is not None:
+            # the task ended without close(), give the connection back in the background
+            asyncio.ensure_future(self._close(state))
+
+    async def _close(self, state):
+        if state.pending is not None and not state.pending.done():
+            # a cancelled task leaves its last statement running in the worker thread
+            await asyncio.wait([asyncio.wrap_future(state.pending)])
+        state.context.run(self.session.setitem, 'connect', None)
+        state.context.run(self.session.close)
+        if state.connection is not None:
+            await self.pool.release_conn(state.connection)
+
+
+class TaskState:
+    __slots__ = ('context', 'connection', 'pending')
+
+    def __init__(self):
+        # an empty context: nothing is inherited from the task that started this one
+        self.context = contextvars.Context()
+        self.connection = None
+        self.pending = None     # concurrent.futures.Future of the statement being executed
+
+
+class AsyncQuery:
+    """
+    Query的asyncio版本，构造条件的方法与Query相同并返回新的AsyncQuery，取得结果的方法需要await，
+    `async for`流式读取结果
+    """
+    def __init__(self, query, session: AsyncSession):
+        self.query = query
+        self.session = session
+
+    def _wrap(self, query):
+        return AsyncQuery(query, self.session)
+
+    def as_models(self):
+        return self._wrap(self.query.as_models())
+
+    def as_tuples(self):
+        return self._wrap(self.query.as_tuples())
+
+    def as_dicts(self):
+        return self._wrap(self.query.as_dicts())
+
+    def as_namedtuples(self):
+        return self._wrap(self.query.as_namedtuples())
+
+    def filter(self, *expressions):
+        return self._wrap(self.query.filter(*expressions))
+
+    def only(self, *fields):
+        return self._wrap(self.query.only(*fields))
+
+    def undefer(self, *fields):
+        return self._wrap(self.query.undefer(*fields))
+
+    def order_by(self, *orderings):
+        return self._wrap(self.query.order_by(*orderings))
+
+    def load(self, *relationships):
+        return self._wrap(self.query.load(*relationships))
+
+    def cache(self, ttl=None, store=None):
+        return self._wrap(self.query.cache(ttl, store))
+
+    def no_cache(self):
+        return self._wrap(self.query.no_cache())
+
+    def limit(self, n):
+        return self._wrap(self.query.limit(n))
+
+    def offset(self, n):
+        return self._wrap(self.query.offset(n))
+
+    async def all(self) -> list:
+        return await self.session.run(self.query.all)
+
+    async def first(self):
+        return await self.session.run(self.query.first)
+
+    async def select_all(self):
+        return await self.session.run(self.query.select_all)
+
+    async def filter_by(self, **kwargs) -> list:
+        return await self.session.run(self.query.filter_by, **kwargs)
+
+    async def get(self, primary_key_value):
+        return await self.session.run(self.query.get, primary_key_value)
+
+    async def get_many(self, primary_key_values, chunk_size=1000) -> list:
+        return await self.session.run(self.query.get_many, primary_key_values, chunk_size)
+
+    async def page(self, page_size, after=None, order_by=None):
+        return await self.session.run(self.query.page, page_size, after, order_by)
+
+    async def to_columns(self, chunk_size=1000, **kwargs) -> dict:
+        return await self.session.run(self.query.to_columns, chunk_size, **kwargs)
+
+    async def to_numpy(self, chunk_size=10000, **kwargs) -> dict:
+        return await self.session.run(self.query.to_numpy, chunk_size, **kwargs)
+
+    async def yield_per(self, n, raw=False, **kwargs):
+        """
+        与`Query.yield_per()`相同，每读取一批都在线程池中执行。
+        mysql产生表单类的实例时，结果从AsyncPool借出的第二个连接读取，task的连接仍可以加载关联，
+        同时流式读取的task数不应超过`maxsize`的一半
+        """
+        session, lent = self.session, None
+        if self.query._own_stream(raw):
+            lent = await session._stream_connection()
+            previous = session._state().context.run(session.session.getitem, 'stream')
+            session._state().context.run(session.session.setitem, 'stream', lent)
+        chunks = self.query.yield_per(n, raw, **kwargs)
+        try:
+            while True:
+                chunk = await session.run(next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            try:
+                # closes the server side cursor when the iteration stops early
+                await session.run(chunks.close)
+            finally:
+                if lent is not None:
+                    state = session._state()
+                    state.context.run(session.session.setitem, 'stream', previous)
+                    if lent is not state.connection:
+                        await session.pool.release_conn(lent)
+
+    async def iter(self, chunk_size=1000, raw=False, **kwargs):
+        async for chunk in self.yield_per(chunk_size, raw, **kwargs):
+            for record in chunk:
+                yield record
+
+    def __aiter__(self):
+        return self.iter()
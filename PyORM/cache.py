@@ -0,0 +1,150 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from weakref import WeakSet
+
+
+class LRUCache:
+    """
+    线程安全、有容量上限的LRU缓存
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.mutex = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        with self.mutex:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.mutex:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.mutex:
+            self.data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# every ResultCache registers itself here, so `invalidate()` reaches all of them
+_result_caches = WeakSet()
+
+
+class ResultCache:
+    """
+    查询结果缓存：(数据库, sql, 参数) -> 查询到的原始行，有容量上限（LRU）和过期时间（TTL）。
+    按数据表记录缓存项，`Session.commit()`写入某张表后，该表的缓存项全部失效
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        :param maxsize: 最多缓存的查询结果数
+        :param ttl: 缓存项的默认存活秒数，None表示只在容量不足或数据表被写入时失效
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()       # key -> (rows, table, expires_at)
+        self.tables = dict()            # table -> set of keys
+        self.generations = dict()       # table -> times it was invalidated
+        self.mutex = Lock()
+        self.hits = 0
+        self.misses = 0
+        _result_caches.add(self)
+
+    def __len__(self):
+        return len(self.data)
+
+    def generation(self, table) -> int:
+        """
+        查询前取得数据表的版本号，查询后用`set()`保存结果时传入，
+        查询期间数据表被写入（版本号改变）时不保存可能过期的结果
+        """
+        with self.mutex:
+            return self.generations.get(table, 0)
+
+    def get(self, key, default=None):
+        with self.mutex:
+            entry = self.data.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, rows, table, ttl=None, generation=None):
+        """
+        :param ttl: 本条缓存的存活秒数，None时使用`self.ttl`
+        :param generation: `generation()`的返回值
+        """
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self.mutex:
+            if generation is not None and generation != self.generations.get(table, 0):
+                return
+            self._pop(key)
+            self.data[key] = (rows, table, expires_at)
+            self.tables.setdefault(table, set()).add(key)
+            while len(self.data) > self.maxsize:
+                self._pop(next(iter(self.data)))
+
+    def invalidate(self, table):
+        """
+        删除数据表`table`的全部缓存项
+        """
+        with self.mutex:
+            self.generations[table] = self.generations.get(table, 0) + 1
+            for key in self.tables.pop(table, ()):
+                self.data.pop(key, None)
+
+    def clear(self):
+        with self.mutex:
+            self.data.clear()
+            self.tables.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self.mutex:
+            return dict(hits=self.hits, misses=self.misses, size=len(self.data), maxsize=self.maxsize)
+
+    def _pop(self, key):
+        entry = self.data.pop(key, None)
+        if entry is not None:
+            keys = self.tables.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tables[entry[1]]
+
+
+def invalidate(*tables):
+    """
+    使全部ResultCache中数据表`tables`的缓存项失效
+    """
+    for cache in list(_result_caches):
+        for table in tables:
+            cache.invalidate(table)
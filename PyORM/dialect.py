@@ -0,0 +1,393 @@
+import os
+import re
+import sqlite3
+import datetime
+from itertools import count
+from PyORM.sql import sql_map
+
+
+class Dialect:
+    """
+    数据库之间的差异：连接、建表语句、upsert、分页、流式读取和执行计划。
+    其余语句都使用`%s`占位符生成，由连接负责转换为数据库驱动的参数形式
+    """
+    name = None
+    # the LIMIT value meaning "no limit", for OFFSET without LIMIT
+    unlimited = None
+    # maximum number of parameters in one statement, None for no limit
+    max_params = None
+    # False when `stream_cursor()` leaves the unread rows on the server, the connection
+    # can not run other statements until the stream is read to the end or closed
+    buffered_stream = True
+
+    def connect(self, **config):
+        raise NotImplementedError
+
+    def database_key(self, config: dict) -> tuple:
+        """
+        :return: 区分数据库的key，查询结果缓存按它区分不同数据库的结果
+        """
+        return self.name, config.get('host'), config.get('port'), config.get('database')
+
+    def ping(self, connection) -> bool:
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def stream_cursor(self, connection):
+        """
+        :return: 逐批从服务端读取结果的游标
+        """
+        return connection.cursor()
+
+    def create_database(self, name):
+        """
+        :return: 创建数据库的语句，不需要创建时为None
+        """
+        return None
+
+    def create_table(self, table_name, columns, indexes, constraints) -> list:
+        """
+        :param columns: 各列的定义
+        :param indexes: 表单类的Index
+        :param constraints: 表级约束，如FOREIGN KEY
+        :return: 建表需要执行的语句
+        """
+        raise NotImplementedError
+
+    def upsert(self, table_name, fields, conflict, size=1) -> str:
+        """
+        :param conflict: 判断记录已经存在的唯一键（primary key或unique字段）
+        :return: 多行插入，记录已存在时更新`fields`中的其余字段
+        """
+        raise NotImplementedError
+
+    def full_scans(self, connection, sql, values=None) -> list:
+        """
+        :return: 执行计划中全表扫描的表
+        """
+        return []
+
+    def load_file(self, cursor, table_name, fields, path) -> (int, int):
+        """
+        将`encode_tsv()`格式的文件导入表中，用于`Session.bulk_load()`
+        :return: (导入的行数, 警告数)
+        """
+        raise NotImplementedError(f'{self.name} does not support bulk loading files')
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}()'
+
+
+class MySQLDialect(Dialect):
+    name = 'mysql'
+    unlimited = '18446744073709551615'
+    buffered_stream = False
+
+    def connect(self, user='', password='', host='localhost', port=3306, **kwargs):
+        import pymysql
+
+        return pymysql.connect(
+            user=user,
+            password=password,
+            host=host,
+            port=port,
+            **kwargs
+        )
+
+    def stream_cursor(self, connection):
+        # unbuffered, the client only holds the rows it has fetched
+        import pymysql.cursors
+
+        return connection.cursor(pymysql.cursors.SSCursor)
+
+    def create_database(self, name):
+        return sql_map['__create_db__'].format(db_name=name)
+
+    def create_table(self, table_name, columns, indexes, constraints) -> list:
+        fields = list(columns)
+        fields.extend(index.ddl() for index in indexes)
+        fields.extend(constraints)
+        return [sql_map['__create__'].format(table_name=table_name, fields=',\n    '.join(fields))]
+
+    def upsert(self, table_name, fields, conflict, size=1) -> str:
+        sql = sql_map['__insert_many__'].format(
+            table_name=table_name,
+            fields=','.join(fields),
+            values=',\n'.join(['(' + ','.join(['%s'] * len(fields)) + ')'] * size),
+        )
+        updates = [f'{k}=VALUES({k})' for k in fields if k not in conflict] or [f'{conflict[0]}={conflict[0]}']
+        return f'{sql[:-1]} \nON DUPLICATE KEY UPDATE {",".join(updates)};'
+
+    def full_scans(self, connection, sql, values=None) -> list:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f'EXPLAIN {sql}', values)
+            names = [each[0] for each in cursor.description]
+            rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        return [row.get('table') for row in rows if row.get('type') == 'ALL']
+
+    def load_file(self, cursor, table_name, fields, path) -> (int, int):
+        # requires local_infile=True in the connection config and on the server
+        from PyORM.utils import _execute
+
+        sql = (
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {table_name} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({','.join(fields)});"
+        )
+        rows = _execute(cursor, sql, (path,)) or 0
+        # with LOCAL, duplicate keys and bad values are warnings instead of errors
+        cursor.execute('SHOW COUNT(*) WARNINGS')
+        warnings = cursor.fetchone()
+        return rows, warnings[0] if warnings else 0
+
+
+class SQLiteCursor:
+    """
+    sqlite游标，将`%s`占位符转换为`?`，execute()与pymysql一样返回受影响的行数
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.raw.cursor()
+
+    def execute(self, sql, args=None):
+        self.cursor.execute(sql.replace('%s', '?'), tuple(args) if args else ())
+        return max(self.cursor.rowcount, 0)
+
+    def executemany(self, sql, args):
+        self.cursor.executemany(sql.replace('%s', '?'), [tuple(each) for each in args])
+        return max(self.cursor.rowcount, 0)
+
+    def fetchall(self):
+        return tuple(self.cursor.fetchall())
+
+    def fetchmany(self, size=1):
+        return tuple(self.cursor.fetchmany(size))
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    """
+    与pymysql连接接口相同的sqlite连接
+    """
+    def __init__(self, raw, dialect):
+        self.raw = raw
+        self.dialect = dialect
+
+    def cursor(self, cursor_class=None):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def ping(self, reconnect=False):
+        self.raw.execute('SELECT 1')
+
+    def close(self):
+        self.raw.close()
+
+
+def _convert_date(value: bytes):
+    return datetime.date.fromisoformat(value.decode())
+
+
+def _convert_datetime(value: bytes):
+    return datetime.datetime.fromisoformat(value.decode())
+
+
+class SQLiteDialect(Dialect):
+    """
+    进程内的sqlite数据库，`database`为文件路径，为空或':memory:'时数据只保存在内存中，
+    同一个SQLiteDialect的全部连接共享这个内存数据库
+    """
+    name = 'sqlite'
+    unlimited = '-1'
+    max_params = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+    # names the in-memory databases, unlike id() never reused by a later dialect
+    _serial = count()
+
+    def __init__(self):
+        # an in-memory database lives as long as one connection to it is open
+        self.keeper = None
+        self.memory = f'file:pyorm-{next(self._serial)}?mode=memory&cache=shared'
+
+    def database_key(self, config: dict) -> tuple:
+        database = config.get('database') or ''
+        if database in ('', ':memory:'):
+            return self.name, self.memory
+        return self.name, database if database.startswith('file:') else os.path.abspath(database)
+
+    def connect(self, database='', timeout=5.0, **kwargs):
+        """
+        mysql的连接参数（user、password、host等）被忽略
+        """
+        # return DATE/DATETIME/TIMESTAMP columns as date and datetime objects, like pymysql
+        sqlite3.register_converter('DATE', _convert_date)
+        sqlite3.register_converter('DATETIME', _convert_datetime)
+        sqlite3.register_converter('TIMESTAMP', _convert_datetime)
+
+        if database in ('', ':memory:'):
+            database, uri = self.memory, True
+        else:
+            uri = database.startswith('file:')
+        raw = sqlite3.connect(
+            database,
+            timeout=timeout,
+            uri=uri,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,    # connections are handed between threads by the pool
+        )
+        raw.execute('PRAGMA foreign_keys = ON')
+        if uri and self.keeper is None:
+            self.keeper = sqlite3.connect(database, uri=True, check_same_thread=False)
+        return SQLiteConnection(raw, self)
+
+    def create_table(self, table_name, columns, indexes, constraints) -> list:
+        fields = [column.replace(' AUTO_INCREMENT', ' AUTOINCREMENT') for column in columns]
+        fields.extend(constraints)
+        statements = ['CREATE TABLE IF NOT EXISTS {table_name}(\n    {fields}\n);'.format(
+            table_name=table_name,
+            fields=',\n    '.join(fields),
+        )]
+        for index in indexes:
+            # index names are global in sqlite, not per table
+            statements.append(
+                f'CREATE {"UNIQUE " if index.unique else ""}INDEX IF NOT EXISTS {table_name}_{index.name} '
+                f'ON {table_name} ({",".join(index.column_names)});'
+            )
+        return statements
+
+    def upsert(self, table_name, fields, conflict, size=1) -> str:
+        sql = sql_map['__insert_many__'].format(
+            table_name=table_name,
+            fields=','.join(fields),
+            values=',\n'.join(['(' + ','.join(['%s'] * len(fields)) + ')'] * size),
+        )
+        updates = [f'{k}=excluded.{k}' for k in fields if k not in conflict]
+        action = f'DO UPDATE SET {",".join(updates)}' if updates else 'DO NOTHING'
+        return f'{sql[:-1]} \nON CONFLICT({",".join(conflict)}) {action};'
+
+    def full_scans(self, connection, sql, values=None) -> list:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', values)
+            details = [row[-1] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        tables = list()
+        for detail in details:
+            # "SCAN students" or "SCAN TABLE students", but not "SCAN students USING INDEX ..."
+            match = re.match(r'SCAN (?:TABLE )?(\w+)$', detail)
+            if match:
+                tables.append(match.group(1))
+        return tables
+
+    def load_file(self, cursor, table_name, fields, path, chunk_size=1000) -> (int, int):
+        """
+        sqlite没有LOAD DATA，逐行解析文件后批量INSERT OR IGNORE；
+        与mysql的LOCAL导入一样，primary key或unique冲突的行被跳过并计为警告
+        """
+        from PyORM.utils import _execute
+
+        sql = 'INSERT OR IGNORE INTO {table_name}({fields}) VALUES ({values});'.format(
+            table_name=table_name,
+            fields=','.join(fields),
+            values=','.join(['%s'] * len(fields)),
+        )
+        lines = rows = 0
+        with open(path, encoding='utf-8', newline='') as f:
+            batch = list()
+            for line in f:
+                batch.append(decode_tsv(line))
+                if len(batch) >= chunk_size:
+                    lines += len(batch)
+                    rows += _execute(cursor, sql, batch, many=True)
+                    batch = list()
+            if batch:
+                lines += len(batch)
+                rows += _execute(cursor, sql, batch, many=True)
+        return rows, lines - rows
+
+
+_tsv_escapes = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+_tsv_unescapes = {'t': '\t', 'n': '\n', 'r': '\r', '0': '\0'}
+
+
+def encode_tsv(values) -> str:
+    """
+    :return: 一行`LOAD DATA`默认格式的文本：制表符分隔，反斜杠转义，NULL为\\N，以换行结尾
+    """
+    li = list()
+    for value in values:
+        if value is None:
+            li.append('\\N')
+        elif isinstance(value, bool):
+            li.append('1' if value else '0')
+        elif isinstance(value, str):
+            li.append(value.translate(_tsv_escapes))
+        elif isinstance(value, float):
+            li.append(repr(value))
+        else:
+            li.append(str(value).translate(_tsv_escapes))
+    return '\t'.join(li) + '\n'
+
+
+def decode_tsv(line: str) -> list:
+    """
+    encode_tsv()的逆过程，值均为字符串或None
+    """
+    values = list()
+    for value in line.rstrip('\n').split('\t'):
+        if value == '\\N':
+            values.append(None)
+        elif '\\' in value:
+            values.append(re.sub(r'\\(.)', lambda m: _tsv_unescapes.get(m.group(1), m.group(1)), value))
+        else:
+            values.append(value)
+    return values
+
+
+dialects = {
+    'mysql': MySQLDialect,
+    'sqlite': SQLiteDialect,
+}
+
+mysql = MySQLDialect()
+
+
+def get_dialect(dialect) -> Dialect:
+    """
+    :param dialect: 'mysql'、'sqlite'或Dialect实例
+    """
+    if isinstance(dialect, Dialect):
+        return dialect
+    if dialect not in dialects:
+        raise ValueError(f'unknown dialect: {dialect}')
+    return dialects[dialect]()
+
+
+def dialect_of(connection) -> Dialect:
+    """
+    :return: 连接所属的数据库，没有`dialect`属性的连接（pymysql）为mysql
+    """
+    return getattr(connection, 'dialect', mysql)
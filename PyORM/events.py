@@ -0,0 +1,212 @@
+import re
+import bisect
+import logging
+from functools import lru_cache
+from threading import Lock
+
+# listeners of each event, checked before any timing is done so that
+# instrumentation costs nothing when no listener is registered
+listeners = {
+    'statement': [],    # StatementEvent, after every statement
+    'acquire': [],      # AcquireEvent, after a connection is taken from a pool
+}
+
+
+def listen(name, callback):
+    """
+    注册事件的监听函数
+    :param name: 'statement'（每条语句执行后）或'acquire'（从连接池取出连接后）
+    :param callback: 接收事件对象的函数，在执行语句的线程中同步调用，应尽量快
+    """
+    if name not in listeners:
+        raise ValueError(f'unknown event: {name}')
+    listeners[name].append(callback)
+    return callback
+
+
+def remove(name, callback):
+    listeners[name].remove(callback)
+
+
+def emit(name, event):
+    for callback in listeners[name]:
+        try:
+            callback(event)
+        except Exception:
+            logging.exception('event listener %r failed', callback)
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(sql: str) -> str:
+    """
+    :return: 语句的形状，批量语句中重复的占位符被折叠，相同形状的语句可以一起统计：
+             WHERE uid IN (%s,%s,%s) -> WHERE uid IN (...)
+    """
+    shape = ' '.join(sql.split())
+    shape = re.sub(r'\(\s*%s(\s*,\s*%s)*\s*\)(\s*,\s*\(\s*%s(\s*,\s*%s)*\s*\))+', '(...),...', shape)
+    shape = re.sub(r'\(\s*%s(\s*,\s*%s)+\s*\)', '(...)', shape)
+    shape = re.sub(r'(WHEN %s THEN %s\s*)+', 'WHEN ... ', shape)
+    return shape
+
+
+class StatementEvent:
+    __slots__ = ('sql', 'params', 'duration', 'rows', 'affected', 'many')
+
+    def __init__(self, sql, params, duration, rows=None, affected=None, many=False):
+        """
+        :param params: 参数个数，executemany时为全部行的参数个数之和
+        :param duration: 执行语句（包括读取结果）的秒数
+        :param rows: 返回的行数，没有结果集的语句为None
+        :param affected: 数据库报告的受影响行数
+        """
+        self.sql = sql
+        self.params = params
+        self.duration = duration
+        self.rows = rows
+        self.affected = affected
+        self.many = many
+
+    @property
+    def shape(self) -> str:
+        return statement_shape(self.sql)
+
+    def __repr__(self):
+        return (f'StatementEvent({self.duration * 1000:.3f}ms, rows={self.rows}, '
+                f'affected={self.affected}, params={self.params}, sql={self.shape!r})')
+
+
+class AcquireEvent:
+    __slots__ = ('wait', 'size', 'idle', 'busy')
+
+    def __init__(self, wait, size, idle, busy):
+        """
+        :param wait: 从连接池取得连接等待的秒数（包括新建连接和ping）
+        :param size: 取出后连接池的连接数
+        """
+        self.wait = wait
+        self.size = size
+        self.idle = idle
+        self.busy = busy
+
+    def __repr__(self):
+        return f'AcquireEvent({self.wait * 1000:.3f}ms, size={self.size}, idle={self.idle}, busy={self.busy})'
+
+
+def count_params(values, many=False) -> int:
+    if not values:
+        return 0
+    if many:
+        return sum(len(each) for each in values)
+    return len(values)
+
+
+class Histogram:
+    """
+    按对数刻度分桶的耗时直方图，用于估算分位数
+    """
+    # upper bounds in seconds: 0.1ms ... ~100s, 4 buckets per power of ten
+    bounds = tuple(10 ** (i / 4) / 10000 for i in range(25))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.mutex = Lock()
+
+    def observe(self, value):
+        with self.mutex:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """
+        :param q: 0到100
+        :return: 分位数的估计值（所在桶的上界），没有数据时为None
+        """
+        with self.mutex:
+            if not self.count:
+                return None
+            rank = q / 100 * self.count
+            seen = 0
+            for i, count in enumerate(self.counts):
+                seen += count
+                if count and seen >= rank:
+                    return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+            return self.max
+
+    def summary(self) -> dict:
+        return dict(
+            count=self.count,
+            total=self.total,
+            mean=self.total / self.count if self.count else None,
+            min=self.min,
+            max=self.max,
+            p50=self.percentile(50),
+            p95=self.percentile(95),
+            p99=self.percentile(99),
+        )
+
+
+class StatementMetrics:
+    """
+    按语句形状汇总耗时直方图、返回行数和受影响行数：
+        metrics = StatementMetrics()
+        listen('statement', metrics)
+        ...
+        metrics.summary()
+    """
+    def __init__(self):
+        self.histograms = dict()
+        self.rows = dict()
+        self.affected = dict()
+        self.mutex = Lock()
+
+    def __call__(self, event: StatementEvent):
+        shape = event.shape
+        histogram = self.histograms.get(shape)
+        if histogram is None:
+            with self.mutex:
+                histogram = self.histograms.setdefault(shape, Histogram())
+        histogram.observe(event.duration)
+        with self.mutex:
+            self.rows[shape] = self.rows.get(shape, 0) + (event.rows or 0)
+            self.affected[shape] = self.affected.get(shape, 0) + (event.affected or 0)
+
+    def summary(self) -> dict:
+        """
+        :return: 语句形状 -> 耗时统计、返回行数、受影响行数，按总耗时从大到小排列
+        """
+        result = dict()
+        for shape, histogram in sorted(self.histograms.items(), key=lambda item: -item[1].total):
+            result[shape] = dict(histogram.summary(), rows=self.rows.get(shape, 0), affected=self.affected.get(shape, 0))
+        return result
+
+    def clear(self):
+        with self.mutex:
+            self.histograms.clear()
+            self.rows.clear()
+            self.affected.clear()
+
+
+class SlowQueryLogger:
+    """
+    记录耗时超过`threshold`秒的语句：
+        listen('statement', SlowQueryLogger(threshold=0.5))
+    """
+    def __init__(self, threshold=1.0, logger=None, level=logging.WARNING):
+        self.threshold = threshold
+        self.logger = logger or logging.getLogger('PyORM.slow_query')
+        self.level = level
+
+    def __call__(self, event: StatementEvent):
+        if event.duration >= self.threshold:
+            self.logger.log(
+                self.level,
+                'slow query %.3fs rows=%s affected=%s params=%s: %s',
+                event.duration, event.rows, event.affected, event.params, event.shape,
+            )
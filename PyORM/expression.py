@@ -0,0 +1,154 @@
+class Expression:
+    """
+    查询条件表达式，由表单字段的比较运算生成，可以用 &(AND)、|(OR)、~(NOT) 组合：
+        (Student.age >= 18) & Student.username.like('l%')
+    compile()返回参数化的sql片段和参数列表
+    """
+    def __and__(self, other):
+        return Clause('AND', self, other)
+
+    def __or__(self, other):
+        return Clause('OR', self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def compile(self) -> (str, list):
+        raise NotImplementedError
+
+
+class Comparison(Expression):
+    def __init__(self, field, operator, value):
+        self.field = field
+        self.operator = operator
+        self.value = value
+
+    def compile(self):
+        return f'{self.field.field_name} {self.operator} %s', [self.value]
+
+
+class Null(Expression):
+    def __init__(self, field, negate=False):
+        self.field = field
+        self.negate = negate
+
+    def compile(self):
+        return f'{self.field.field_name} IS {"NOT " if self.negate else ""}NULL', []
+
+
+class In(Expression):
+    def __init__(self, field, values, negate=False):
+        self.field = field
+        self.values = list(values)
+        self.negate = negate
+
+    def compile(self):
+        if not self.values:
+            # `col IN ()` is not valid sql
+            return ('1=1' if self.negate else '1=0'), []
+        placeholder = ','.join(['%s'] * len(self.values))
+        return f'{self.field.field_name} {"NOT " if self.negate else ""}IN ({placeholder})', list(self.values)
+
+
+class Between(Expression):
+    def __init__(self, field, low, high):
+        self.field = field
+        self.low = low
+        self.high = high
+
+    def compile(self):
+        return f'{self.field.field_name} BETWEEN %s AND %s', [self.low, self.high]
+
+
+class Clause(Expression):
+    def __init__(self, operator, *expressions):
+        self.operator = operator
+        self.expressions = list()
+        for each in expressions:
+            if not isinstance(each, Expression):
+                raise TypeError(f'expect an expression, got {type(each)}')
+            # flatten (a AND b) AND c into a AND b AND c
+            if isinstance(each, Clause) and each.operator == operator:
+                self.expressions.extend(each.expressions)
+            else:
+                self.expressions.append(each)
+
+    def compile(self):
+        sql, values = list(), list()
+        for each in self.expressions:
+            each_sql, each_values = each.compile()
+            sql.append(f'({each_sql})' if isinstance(each, Clause) else each_sql)
+            values.extend(each_values)
+        return f' {self.operator} '.join(sql), values
+
+
+class Not(Expression):
+    def __init__(self, expression):
+        self.expression = expression
+
+    def compile(self):
+        sql, values = self.expression.compile()
+        return f'NOT ({sql})', values
+
+
+class Ordering:
+    def __init__(self, field, descending=False):
+        self.field = field
+        self.descending = descending
+
+    def compile(self) -> str:
+        return f'{self.field.field_name} {"DESC" if self.descending else "ASC"}'
+
+
+class Operators:
+    """
+    表单字段上的运算符，比较运算返回Expression而不是bool
+    """
+    # fields are still used as dict values and set members
+    __hash__ = object.__hash__
+
+    def __eq__(self, other):
+        if other is None:
+            return Null(self)
+        return Comparison(self, '=', other)
+
+    def __ne__(self, other):
+        if other is None:
+            return Null(self, negate=True)
+        return Comparison(self, '<>', other)
+
+    def __lt__(self, other):
+        return Comparison(self, '<', other)
+
+    def __le__(self, other):
+        return Comparison(self, '<=', other)
+
+    def __gt__(self, other):
+        return Comparison(self, '>', other)
+
+    def __ge__(self, other):
+        return Comparison(self, '>=', other)
+
+    def in_(self, values):
+        return In(self, values)
+
+    def not_in(self, values):
+        return In(self, values, negate=True)
+
+    def between(self, low, high):
+        return Between(self, low, high)
+
+    def like(self, pattern):
+        return Comparison(self, 'LIKE', pattern)
+
+    def is_null(self):
+        return Null(self)
+
+    def is_not_null(self):
+        return Null(self, negate=True)
+
+    def asc(self):
+        return Ordering(self)
+
+    def desc(self):
+        return Ordering(self, descending=True)
@@ -1,25 +1,60 @@
 import sys
 import datetime
 from abc import ABC, abstractmethod
+from PyORM.expression import Operators
 
 
 class NoneValue:
     pass
 
 
-class Field(ABC):
+class Field(Operators, ABC):
     def __set_name__(self, owner, name):
         self.field_name = name
+        self.model = owner
+
+    # position of the field in `Model._row` and its bit in `Model._dirty`, assigned by ModelMeta
+    position = None
+    mask = 0
+    # deferred fields are not selected by default and loaded on first access
+    deferred = False
+    # numpy dtype of the column in `Query.to_numpy()`, None for object arrays
+    dtype = None
 
     def __get__(self, instance, owner):
+        if instance is None:    # `Student.age` is used to build query expressions
+            return self
         try:
-            return instance.kv_map[self.field_name]
+            value = instance._row[self.position]
         except AttributeError:
             raise RuntimeError(f'model field `{self.field_name}` is not assigned', )
+        if value is NoneValue and self.deferred and instance.read_from_db:
+            value = self.load(instance)
+        return value
+
+    def load(self, instance):
+        """
+        加载延迟加载的字段：同一次查询得到的记录中该字段都未加载的，一起用一次查询加载。
+        记录来自mysql的流式查询时，绑定Session的查询在当前上下文的连接上加载（流式读取使用另一个连接），
+        绑定连接的查询在迭代结束前加载会抛出RuntimeError，连接上未读完的结果不会被截断
+        """
+        from PyORM.relationship import load_column
+
+        context = getattr(instance, '_context', None)
+        if context is None:     # not read by a query, nothing to load from
+            return NoneValue
+        records = [each for each in context.alive() if each._row[self.position] is NoneValue]
+        load_column(self, records, context.bind)
+        return instance._row[self.position]
 
     def __set__(self, instance, value):
         self.validate(value)
-        instance.kv_map[self.field_name] = self.format(value)
+        value = self.format(value)
+        row = instance._row
+        old = row[self.position]
+        if old is NoneValue or old != value:
+            row[self.position] = value
+            instance._dirty |= self.mask
 
     @classmethod
     def generate_ddl(
@@ -53,6 +88,18 @@ class Field(ABC):
         # if not pass the validation, raise Error
         pass
 
+    def validate_column(self, values) -> list:
+        """
+        验证并格式化一整列的值（list、array.array或numpy数组），用于`Model.bulk_create()`。
+        默认逐个调用validate()和format()，子类按列一次完成验证
+        :return: 格式化后的值的列表
+        """
+        result = list()
+        for value in as_list(values):
+            self.validate(value)
+            result.append(self.format(value))
+        return result
+
     @abstractmethod
     def ddl(self) -> str:
         pass
@@ -63,7 +110,48 @@ class Field(ABC):
         pass
 
 
+def as_list(values) -> list:
+    # numpy arrays and array.array turn into lists of python scalars
+    return values.tolist() if hasattr(values, 'tolist') else list(values)
+
+
+def array_kind(values):
+    """
+    :return: numpy数组的dtype.kind（'i'、'u'、'f'、'U'、'b'等），不是numpy数组时为None
+    """
+    return getattr(getattr(values, 'dtype', None), 'kind', None)
+
+
+class Index:
+    """
+    数据表索引，在表单类中声明：
+        idx_age_height = Index('age', 'height')
+        idx_name = Index(username, unique=True)
+    单个字段的索引也可以用字段的`index=True`声明
+    """
+    def __init__(self, *columns, unique=False, name=None):
+        if not columns:
+            raise ValueError('index requires at least one column')
+        self.columns = columns
+        self.unique = unique
+        self.name = name
+
+    def __set_name__(self, owner, name):
+        if self.name is None:
+            self.name = name
+
+    @property
+    def column_names(self) -> tuple:
+        # fields get their names only after the class body is executed
+        return tuple(each if isinstance(each, str) else each.field_name for each in self.columns)
+
+    def ddl(self) -> str:
+        return f'{"UNIQUE " if self.unique else ""}INDEX {self.name} ({",".join(self.column_names)})'
+
+
 class Integer(Field):
+    dtype = 'int64'
+
     def __init__(
         self,
         column_type='INTEGER',
@@ -73,10 +161,14 @@ class Integer(Field):
         auto_increment=False,
         minvalue=-sys.maxsize-1,
         maxvalue=sys.maxsize,
+        index=False,
+        deferred=False,
     ):
         self.column_type = column_type
         self.default = default
         self.unique = unique
+        self.index = index
+        self.deferred = deferred
         self.minvalue = minvalue
         self.maxvalue = maxvalue
         self.primary_key = primary_key
@@ -100,6 +192,26 @@ class Integer(Field):
         else:
             raise ValueError(f'integer validation fail, value is {value}')
 
+    def validate_column(self, values) -> list:
+        if array_kind(values) in ('i', 'u'):
+            # the range check runs on the array, no python object per value
+            if len(values) and (values.min() < self.minvalue or values.max() > self.maxvalue):
+                raise ValueError(f'integer validation fail, values out of [{self.minvalue}, {self.maxvalue}]')
+            return values.tolist()
+
+        values = as_list(values)
+        present = [value for value in values if value is not None]   # None is NULL
+        types = set(map(type, present))
+        if not types <= {int, bool}:
+            for value in present:
+                if not isinstance(value, int):
+                    raise ValueError(f'integer validation fail, value is {value}')
+        if present and (min(present) < self.minvalue or max(present) > self.maxvalue):
+            raise ValueError(f'integer validation fail, values out of [{self.minvalue}, {self.maxvalue}]')
+        if bool in types:
+            return [value if value is None else int(value) for value in values]
+        return values
+
     def format(self, value) -> [int, float, str, bool, None]:
         if value is None:   # when value equals `None`, it represents value `NULL` in mysql
             return value
@@ -108,6 +220,8 @@ class Integer(Field):
 
 
 class Double(Field):
+    dtype = 'float64'
+
     def __init__(
         self,
         column_type='DOUBLE',
@@ -116,6 +230,8 @@ class Double(Field):
         primary_key=False,
         default=None,
         unique=False,
+        index=False,
+        deferred=False,
     ):
         self.column_type = column_type
         self.m = m
@@ -123,6 +239,8 @@ class Double(Field):
         self.primary_key = primary_key
         self.default = default
         self.unique = unique
+        self.index = index
+        self.deferred = deferred
 
     def ddl(self):
         if self.m and self.d:
@@ -143,6 +261,14 @@ class Double(Field):
         except ValueError as e:
             raise ValueError(f'Double validation fail at value {value}')
 
+    def validate_column(self, values) -> list:
+        if array_kind(values) in ('i', 'u', 'f'):
+            return values.astype(float).tolist()
+        try:
+            return list(map(float, as_list(values)))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'Double validation fail: {e}')
+
     def format(self, value) -> [int, float, str, bool, None]:
         return float(value)
 
@@ -155,12 +281,16 @@ class String(Field):
         primary_key=False,
         default=None,
         unique=False,
+        index=False,
+        deferred=False,
     ):
         self.max_length = max_length
         self.primary_key = primary_key
         self.column_type = column_type
         self.default = default
         self.unique = unique
+        self.index = index
+        self.deferred = deferred
 
     def ddl(self):
         return self.generate_ddl(
@@ -176,22 +306,43 @@ class String(Field):
             return
         raise ValueError(f'string validation fail at value {value}')
 
+    def validate_column(self, values) -> list:
+        # a numpy unicode array stores 4 bytes per character, the longest fitting string is itemsize // 4
+        checked = array_kind(values) == 'U' and values.dtype.itemsize // 4 <= self.max_length
+        values = as_list(values)
+        if checked:
+            return values
+        if set(map(type, values)) - {str}:
+            for value in values:
+                if not isinstance(value, str):
+                    raise ValueError(f'string validation fail at value {value}')
+        if values and max(map(len, values)) > self.max_length:
+            value = next(value for value in values if len(value) > self.max_length)
+            raise ValueError(f'string validation fail at value {value}')
+        return values
+
     def format(self, value) -> [int, float, str, None, bool]:
         return value
 
 
 class Boolean(Field):
+    dtype = 'bool'
+
     def __init__(
         self,
         column_type='boolean',
         default=None,
         primary_key=False,
         unique=False,
+        index=False,
+        deferred=False,
     ):
         self.column_type = column_type
         self.default = default
         self.primary_key = primary_key
         self.unique = unique
+        self.index = index
+        self.deferred = deferred
 
     def ddl(self):
         return self.generate_ddl(
@@ -213,22 +364,34 @@ class Boolean(Field):
         if value is not True and value is not False:
             raise ValueError(f'True or False are expected, got {type(value)}')
 
+    def validate_column(self, values) -> list:
+        values = as_list(values)
+        if set(map(type, values)) <= {bool, int} and set(values) <= {0, 1}:
+            return values
+        return super().validate_column(values)
+
     def format(self, value) -> [int, float, str, bool, None]:
         return value
 
 
 class Date(Field):
+    dtype = 'datetime64[D]'
+
     def __init__(
         self,
         column_type='DATE',
         default=None,
         primary_key=False,
         unique = False,
+        index=False,
+        deferred=False,
     ):
         self.column_type = column_type
         self.default = default
         self.primary_key = primary_key
         self.unique = unique
+        self.index = index
+        self.deferred = deferred
 
     def ddl(self):
         return self.generate_ddl(
@@ -257,17 +420,23 @@ class Date(Field):
 
 
 class DateTime(Field):
+    dtype = 'datetime64[s]'
+
     def __init__(
         self,
         column_type='DATETIME',
         default=None,
         primary_key=False,
-        unique=False
+        unique=False,
+        index=False,
+        deferred=False,
     ):
         self.column_type = column_type
         self.default = default
         self.primary_key = primary_key
         self.unique = unique
+        self.index = index
+        self.deferred = deferred
 
     def ddl(self):
         return self.generate_ddl(
@@ -295,17 +464,23 @@ class DateTime(Field):
 
 
 class TimeStamp(Field):
+    dtype = 'datetime64[s]'
+
     def __init__(
         self,
         column_type='TIMESTAMP',
         default=None,
         primary_key=False,
-        unique=False
+        unique=False,
+        index=False,
+        deferred=False,
     ):
         self.column_type = column_type
         self.default = default
         self.primary_key = primary_key
         self.unique = unique
+        self.index = index
+        self.deferred = deferred
 
     def ddl(self):
         return self.generate_ddl(
@@ -329,3 +504,90 @@ class TimeStamp(Field):
             return value.strftime('%Y-%m-%d %H:%M:%S')
         elif isinstance(value, int):
             return datetime.datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ForeignKey(Field):
+    """
+    外键字段，引用另一张表的字段（通常是primary key），建表时生成FOREIGN KEY约束：
+        student_id = ForeignKey(Student.uid, on_delete='CASCADE')
+        student_id = ForeignKey('students.uid')
+    """
+    def __init__(
+        self,
+        target,
+        column_type=None,
+        on_delete=None,
+        on_update=None,
+        default=None,
+        primary_key=False,
+        unique=False,
+        index=False,
+    ):
+        """
+        :param target: 被引用的字段，或'表名.字段名'
+        :param column_type: 列的类型，默认与被引用的字段相同（引用'表名.字段名'时为INTEGER）
+        :param on_delete: CASCADE、SET NULL、RESTRICT等
+        """
+        if isinstance(target, str) and len(target.split('.')) != 2:
+            raise ValueError(f"foreign key target must be a field or 'table.column', got {target!r}")
+        self.target = target
+        self.column_type = column_type
+        self.on_delete = on_delete
+        self.on_update = on_update
+        self.default = default
+        self.primary_key = primary_key
+        self.unique = unique
+        self.index = index
+
+    @property
+    def dtype(self):
+        if isinstance(self.target, Field):
+            return self.target.dtype
+        return 'int64' if self.column_type in (None, 'INTEGER') else None
+
+    @property
+    def references(self) -> (str, str):
+        """
+        :return: (被引用的表名, 被引用的字段名)
+        """
+        if isinstance(self.target, str):
+            table_name, column = self.target.split('.')
+            return table_name, column
+        return self.target.model.table_name, self.target.field_name
+
+    def ddl(self):
+        column_type = self.column_type
+        if column_type is None:
+            if isinstance(self.target, Field):
+                column_type = self.target.column_type
+                if isinstance(self.target, String):
+                    column_type = f'{column_type}({self.target.max_length})'
+            else:
+                column_type = 'INTEGER'
+        return self.generate_ddl(
+            field_name=self.field_name,
+            column_type=column_type,
+            primary_key=self.primary_key,
+            default=self.default,
+            unique=self.unique,
+        )
+
+    def constraint_ddl(self) -> str:
+        table_name, column = self.references
+        li = [f'FOREIGN KEY ({self.field_name}) REFERENCES {table_name}({column})']
+        if self.on_delete:
+            li.append(f'ON DELETE {self.on_delete}')
+        if self.on_update:
+            li.append(f'ON UPDATE {self.on_update}')
+        return ' '.join(li)
+
+    def validate(self, value):
+        if value is None:   # NULL means no reference
+            return
+        if isinstance(self.target, Field):
+            self.target.validate(value)
+
+    def format(self, value) -> [int, float, str, bool, None]:
+        if value is None or not isinstance(self.target, Field):
+            return value
+        return self.target.format(value)
@@ -1,23 +1,50 @@
 from abc import ABCMeta
-from PyORM.fields import Field, NoneValue
-from PyORM.sql import sql_map
+from collections import namedtuple
+from PyORM.fields import Field, ForeignKey, Index, NoneValue
+from PyORM.relationship import Relationship
+from PyORM.sql import sql_map, compile_statement, compile_select
+from PyORM.cache import LRUCache, invalidate
 from PyORM.query import Query, QueryDescriptor
-from PyORM.utils import execute_sql
+from PyORM.utils import execute_sql, execute_statements, batches
+from PyORM.dialect import mysql, dialect_of
+from PyORM.session import Session
 
 
 class ModelMeta(ABCMeta):
-    def __new__(mcs, name, bases, attrs):
+    def __new__(mcs, name, bases, attrs, compact=False, shard_key=None, shard_map=None):
+        """
+        :param compact: 为True时表单类声明`__slots__ = ()`，实例没有`__dict__`，
+                        只保存字段值列表和少量状态，适合在内存中缓存大量记录
+        :param shard_key: 分片键的字段名
+        :param shard_map: 分片键的值 -> 分片序号（HashShardMap、RangeShardMap），
+                          Session配置了分片时这张表的读写按它路由到各分片
+        """
         if name == 'Model':
             return type.__new__(mcs, name, bases, attrs)
 
         kd_map = dict()           # field_name, field_descriptor map
         primary_key = None
         unique_keys = list()
+        indexes = list()
+        foreign_keys = list()
+        relationships = dict()
         for k, v in attrs.items():
-            if isinstance(v, Field):
+            if isinstance(v, Index):
+                indexes.append(v)
+            elif isinstance(v, Relationship):
+                relationships[k] = v
+            elif isinstance(v, Field):
+                v.position = len(kd_map)
+                v.mask = 1 << v.position
                 kd_map[k] = v
                 if v.unique:
                     unique_keys.append(k)
+                if v.index:
+                    indexes.append(Index(k, name=f'ix_{k}'))
+                if isinstance(v, ForeignKey):
+                    foreign_keys.append(v)
+                if v.deferred and v.primary_key:
+                    raise AttributeError('primary key can not be deferred')
                 if primary_key and v.primary_key:
                     raise AttributeError('duplicate primary key')
                 elif not primary_key and v.primary_key:
@@ -26,65 +53,271 @@ class ModelMeta(ABCMeta):
         attrs['__kd_map__'] = kd_map
         attrs['__primary_key__'] = primary_key
         attrs['__unique_key__'] = unique_keys
+        attrs['__indexes__'] = indexes
+        attrs['__foreign_keys__'] = foreign_keys
+        attrs['__relationships__'] = relationships
+        # columns selected by default, deferred fields are loaded on first access
+        attrs['__deferred__'] = tuple(k for k, v in kd_map.items() if v.deferred)
+        attrs['__default_columns__'] = tuple(k for k, v in kd_map.items() if not v.deferred)
+        if attrs['__deferred__'] and not primary_key:
+            raise AttributeError('deferred fields require a primary key')
+        if (shard_key is None) != (shard_map is None):
+            raise AttributeError('shard_key and shard_map must be declared together')
+        if shard_key is not None and shard_key not in kd_map:
+            raise AttributeError(f'shard key `{shard_key}` is not a field')
+        attrs['__shard_key__'] = shard_key
+        attrs['__shard_map__'] = shard_map
+        # compiled sql statements, keyed by (operation, fields, size)
+        attrs['__sql_cache__'] = LRUCache(maxsize=attrs.get('__sql_cache_size__', 256))
+        # row hydrators and namedtuple types, keyed by (kind, fields)
+        attrs['__hydrators__'] = dict()
+        if compact:
+            attrs.setdefault('__slots__', ())
 
-        return type.__new__(mcs, name, bases, attrs)
+        cls = type.__new__(mcs, name, bases, attrs)
+        for index in indexes:
+            for column in index.column_names:
+                if column not in kd_map:
+                    raise AttributeError(f'index `{index.name}` refers to unknown field `{column}`')
+        return cls
 
 
 class Model(metaclass=ModelMeta):
+    # field values are stored in the list `_row`, ordered as `__kd_map__`,
+    # `_dirty` is a bit mask of the fields changed since load or the last flush,
+    # `_related` holds loaded relationships and `_context` the query batch the record came from
+    __slots__ = ('_row', '_dirty', 'read_from_db', '_related', '_context', '__weakref__')
 
     table_name = ''
     query = QueryDescriptor()
+    # set to a `ResultCache` to cache the results of every query on this model
+    __cache__ = None
+    # declared with the class keywords `shard_key` and `shard_map`
+    __shard_key__ = None
+    __shard_map__ = None
 
     def __init__(self, **kwargs):
         self.read_from_db = False
-        self.kv_map = dict.fromkeys(self.__kd_map__.keys(), NoneValue)
+        self._row = [NoneValue] * len(self.__kd_map__)
+        self._dirty = 0
 
     def __setitem__(self, key, value):
         setattr(self, key, value)
 
     def __getitem__(self, item):
-        getattr(self, item)
+        return getattr(self, item)
 
     def __repr__(self):
         k_v = [f'{k}={v}' for k, v in self.kv_map.items()]
         return f'{self.__class__}({",".join(k_v)})'
 
+    @property
+    def kv_map(self) -> dict:
+        """
+        :return: 字段名到字段值的字典（副本，修改它不会影响记录）
+        """
+        return dict(zip(self.__kd_map__, self._row))
+
     def keys(self) -> tuple:
         """
         :return: 返回数据库记录各列的列名
         """
-        return tuple(self.kv_map.keys())
+        return tuple(self.__kd_map__)
 
     def values(self) -> tuple:
         """
         :return: 返回数据库记录各个字段的值组成的元组
         """
-        return tuple(self.kv_map.values())
+        return tuple(self._row)
+
+    def dirty_keys(self) -> tuple:
+        """
+        :return: 从数据库读取或上一次提交之后被修改过的字段名
+        """
+        return tuple(k for k, v in self.__kd_map__.items() if self._dirty & v.mask)
 
     @classmethod
-    def ddl(cls):
+    def select_statement(
+            cls,
+            columns: tuple,
+            where=None,
+            order_by=(),
+            limit=False,
+            offset=False,
+            dialect=None,
+    ) -> str:
+        """
+        :param dialect: 数据库，默认为mysql
+        :return: 编译后的SELECT语句，同样缓存在表单类的LRU缓存中
         """
+        dialect = dialect or mysql
+        key = ('select', columns, where, order_by, limit, offset, dialect.name)
+        sql = cls.__sql_cache__.get(key)
+        if sql is None:
+            sql = compile_select(cls.table_name, columns, where, order_by, limit, offset, dialect.unlimited)
+            cls.__sql_cache__.set(key, sql)
+        return sql
+
+    @classmethod
+    def hydrator(cls, fields=None):
+        """
+        :param fields: 行中各列对应的字段名，None表示全部字段（按声明顺序）
+        :return: 将数据库返回的一行转换为实例的函数。
+                 数据库中的值已经是合法的，所以不调用`__init__`，也不做字段验证
+        """
+        fields = tuple(cls.__kd_map__) if fields is None else fields
+        hydrate = cls.__hydrators__.get(('model', fields))
+        if hydrate is None:
+            hydrate = cls._generate_hydrator(fields)
+            cls.__hydrators__[('model', fields)] = hydrate
+        return hydrate
+
+    @classmethod
+    def _generate_hydrator(cls, fields: tuple):
+        new = cls.__new__
+        if fields == tuple(cls.__kd_map__):
+            def hydrate(row):
+                record = new(cls)
+                record._row = list(row)
+                record._dirty = 0
+                record.read_from_db = True
+                return record
+        else:
+            positions = [cls.__kd_map__[k].position for k in fields]
+            width = len(cls.__kd_map__)
+
+            def hydrate(row):
+                record = new(cls)
+                values = [NoneValue] * width
+                for i, value in zip(positions, row):
+                    values[i] = value
+                record._row = values
+                record._dirty = 0
+                record.read_from_db = True
+                return record
+        return hydrate
+
+    @classmethod
+    def bulk_create(cls, bind, columns: dict, max_batch_rows=1000, max_batch_bytes=1024 * 1024) -> int:
+        """
+        按列批量插入，不创建表单类的实例：每列调用一次`Field.validate_column()`，再直接生成多行INSERT
+            Student.bulk_create(db.session, columns={'age': ages, 'username': names})
+        :param bind: Session（使用它的连接和批量设置）或数据库连接
+        :param columns: 字段名 -> 一列值（list、array.array或numpy数组），未提供的字段使用数据库默认值
+        :param max_batch_rows: `bind`为连接时，一条INSERT最多包含的行数
+        :param max_batch_bytes: `bind`为连接时，一条INSERT参数的估算字节数上限
+        :return: 插入的行数
+        """
+        fields = tuple(k for k in cls.__kd_map__ if k in columns)
+        unknown = set(columns) - set(fields)
+        if unknown:
+            raise AttributeError(f'{cls.__name__} has no field {", ".join(sorted(unknown))}')
+        if not fields:
+            return 0
+
+        data = [cls.__kd_map__[k].validate_column(columns[k]) for k in fields]
+        lengths = {len(each) for each in data}
+        if len(lengths) != 1:
+            raise ValueError(f'columns have different lengths: {dict(zip(fields, map(len, data)))}')
+        rows = zip(*data)
+
+        if isinstance(bind, Session):
+            return bind.insert_rows(cls, fields, rows)
+
+        dialect = dialect_of(bind)
+        if dialect.max_params:
+            max_batch_rows = max(min(max_batch_rows, dialect.max_params // len(fields)), 1)
+        count = 0
+
+        def statements():
+            nonlocal count
+            for batch in batches(rows, max_batch_rows, max_batch_bytes):
+                count += len(batch)
+                args = list()
+                for row in batch:
+                    args.extend(row)
+                yield cls.statement('insert', fields, len(batch)), tuple(args), False
+
+        execute_statements(bind, statements())
+        invalidate(cls.table_name)
+        return count
+
+    @classmethod
+    def row_type(cls, fields=None):
+        """
+        :return: 字段名为属性的namedtuple类型
+        """
+        fields = tuple(cls.__kd_map__) if fields is None else fields
+        row_type = cls.__hydrators__.get(('namedtuple', fields))
+        if row_type is None:
+            row_type = namedtuple(f'{cls.__name__}Row', fields)
+            cls.__hydrators__[('namedtuple', fields)] = row_type
+        return row_type
+
+    @classmethod
+    def ddl(cls, dialect=None):
+        """
+        :param dialect: 数据库，默认为mysql
         :return: 返回数据表的定义语句
         """
-        fields_ddl = [v.ddl() for k, v in cls.__kd_map__.items()]
-        sql = sql_map['__create__'].format(
-            table_name=cls.table_name,
-            fields=',\n    '.join(fields_ddl)
+        return '\n'.join(cls.ddl_statements(dialect))
+
+    @classmethod
+    def ddl_statements(cls, dialect=None) -> list:
+        """
+        :return: 建表需要执行的语句（sqlite的索引需要单独创建）
+        """
+        return (dialect or mysql).create_table(
+            cls.table_name,
+            [v.ddl() for k, v in cls.__kd_map__.items()],
+            cls.__indexes__,
+            [foreign_key.constraint_ddl() for foreign_key in cls.__foreign_keys__],
         )
+
+    @classmethod
+    def statement(cls, operation, fields=(), size=1, dialect=None) -> str:
+        """
+        :param operation: insert, update, update_case, delete, upsert
+        :param fields: 语句涉及的字段（元组）
+        :param size: 批量语句包含的行数
+        :param dialect: 数据库，只有upsert需要
+        :return: 编译后的sql语句，按(operation, fields, size)缓存在表单类的LRU缓存中
+        """
+        key = (operation, fields, size, dialect.name if operation == 'upsert' else None)
+        sql = cls.__sql_cache__.get(key)
+        if sql is None:
+            if operation == 'upsert':
+                sql = dialect.upsert(cls.table_name, fields, cls.conflict_keys(), size)
+            else:
+                sql = compile_statement(cls.table_name, cls.__primary_key__, operation, fields, size)
+            cls.__sql_cache__.set(key, sql)
         return sql
 
+    @classmethod
+    def conflict_keys(cls) -> tuple:
+        """
+        :return: upsert判断记录是否已经存在的字段：primary key，没有时为第一个unique字段
+        """
+        if cls.__primary_key__:
+            return (cls.__primary_key__, )
+        if cls.__unique_key__:
+            return (cls.__unique_key__[0], )
+        raise RuntimeError(f'{cls.__name__} has no primary key or unique field for upsert')
+
     @classmethod
     def execute(cls, connection, sql, values=None):
         return execute_sql(connection, sql, values)
 
     @classmethod
     def create_table(cls, connection):
-        cls.execute(connection, cls.ddl())
+        for sql in cls.ddl_statements(dialect_of(connection)):
+            cls.execute(connection, sql)
 
     @classmethod
     def drop_table(cls, connection):
         sql = sql_map['__drop__'].format(table_name=cls.table_name)
         cls.execute(connection, sql)
+        invalidate(cls.table_name)
 
 
 if __name__ == '__main__':
@@ -1,97 +1,259 @@
+import time
 import logging
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition, Event, Thread
 
-import pymysql
-from threading import Timer, Lock
-from queue import Queue
+from PyORM import events
+from PyORM.dialect import get_dialect
 
 
 class Pool:
     """
-    数据库连接池（未完成）
+    线程安全的数据库连接池
     功能：
-    1. 创建一个指定大小的数据库连接池
-    2. 获取一个数据库连接
-    3. 动态保持连接池的大小
+    1. 第一次获取连接时才创建`minsize`个连接，之后按需增长，最多`maxsize`个
+    2. 连接用尽时最多等待`timeout`秒，超时抛出`TimeoutError`
+    3. 取出连接时先ping，已断开或超过`max_lifetime`的连接会被替换
+    4. 后台线程每隔`interval`秒关闭空闲超过`max_idle`秒的连接（保留`minsize`个）
+       以及存活超过`max_lifetime`秒的连接
 
-    难点：
-    1. 如何回收连接（用户得手动释放连接）
-    2. 如何避免连接池的代码入侵其他代码
+    用法：
+        pool = Pool(user='root', password='123456', database='test_orm', maxsize=10)
+        with pool.connection() as conn:
+            ...
+        pool.close()
     """
     def __init__(
         self,
-        user,
-        password,
-        db,
+        user='',
+        password='',
+        database='',
         host='localhost',
         port=3306,
         minsize=1,
         maxsize=7,
         timeout=5,
         interval=1.0,
-        autocommit=False
+        max_idle=300,
+        max_lifetime=3600,
+        autocommit=False,
+        creator=None,
+        dialect='mysql',
+        **kwargs
     ):
-        self.user = user
-        self.password = password
-        self.db = db
-        self.host = host
-        self.port = port
+        """
+        :param creator: 创建连接的函数，默认使用`dialect`和上面的连接参数
+        :param dialect: 数据库，'mysql'、'sqlite'或Dialect实例
+        """
+        if not 0 <= minsize <= maxsize or maxsize < 1:
+            raise ValueError(f'require 0 <= minsize <= maxsize and maxsize >= 1, got {minsize}, {maxsize}')
+
+        self.config = dict(
+            user=user,
+            password=password,
+            database=database,
+            host=host,
+            port=port,
+            autocommit=autocommit,
+        )
+        self.config.update(kwargs)
+        self.dialect = get_dialect(dialect)
+        self.creator = creator or (lambda: self.dialect.connect(**self.config))
+
         self.minsize = minsize
         self.maxsize = maxsize
-        self.interval = interval
         self.timeout = timeout
-        self.autocommit = autocommit
+        self.interval = interval
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+
+        self.mutex = Condition()
+        self.idle_connect = deque()     # [conn, created_at, last_used_at], the right end is the warmest
+        self.busy_connect = dict()      # id(conn) -> (conn, created_at)
+        self.size = 0                   # idle + busy + being created
+        self.warmed = False
+        self.closed = False
 
-        self.mutex = Lock()
-        self.busy_connect = set()
-        self.idle_connect = Queue(maxsize=self.maxsize)
-        for i in range(self.maxsize):
-            self.idle_connect.put(self.create_a_connect())
+        # the watch dog is started together with the lazy warmup
+        self.stop_event = Event()
+        self.watch_dog = Thread(target=self._watch_loop, name='PyORM-pool-watch-dog', daemon=True)
 
-        # start a watch dog to maintain the size of pool
-        self.watch_dog = Timer(interval=self.interval, function=self.watch, args=(self.idle_connect, self.busy_connect))
-        self.watch_dog.run()
+    @property
+    def idle(self) -> int:
+        return len(self.idle_connect)
+
+    @property
+    def busy(self) -> int:
+        return len(self.busy_connect)
 
     def create_a_connect(self):
-        return pymysql.connect(
-            user=self.user,
-            password=self.password,
-            db=self.db,
-            host=self.host,
-            port=self.port,
-            connect_timeout=self.timeout,
-            autocommit=self.autocommit
-        )
+        return self.creator()
 
-    def watch(self, idle_connect: Queue, busy_connect: Queue):
-        sz = idle_connect.qsize() + busy_connect.qsize()
-        if sz < self.maxsize:
-            for i in range(self.maxsize-sz):
-                self.idle_connect.put(self.create_a_connect())
+    def warmup(self):
+        with self.mutex:
+            if self.warmed or self.closed:
+                return
+            self.warmed = True
+            missing = max(self.minsize - self.size, 0)
+            self.size += missing
+        self._fill(missing)
+        self.watch_dog.start()
+
+    def acquire_conn(self, timeout=None):
+        """
+        :param timeout: 连接用尽时最多等待的秒数，默认为`self.timeout`
+        :return: 一个可用的连接，用完后必须调用`release_conn()`归还
+        """
+        start = time.monotonic()
+        if not self.warmed:
+            self.warmup()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = start + timeout
+
+        while True:
+            with self.mutex:
+                while not self.idle_connect and self.size >= self.maxsize and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f'no connection available in {timeout}s, pool size is {self.maxsize}')
+                    self.mutex.wait(remaining)
+                if self.closed:
+                    raise RuntimeError('pool is closed')
+                if self.idle_connect:
+                    conn, created_at, _ = self.idle_connect.pop()
+                else:
+                    conn, created_at = None, None
+                    self.size += 1
+
+            if conn is None:
+                try:
+                    conn = self.create_a_connect()
+                except Exception as e:
+                    self._forget(1)
+                    raise e
+                created_at = time.monotonic()
+            elif self._expired(created_at) or not self.dialect.ping(conn):
+                self._discard(conn)
+                continue
 
-    def acquire_conn(self):
+            with self.mutex:
+                self.busy_connect[id(conn)] = (conn, created_at)
+            if events.listeners['acquire']:
+                events.emit('acquire', events.AcquireEvent(time.monotonic() - start, self.size, self.idle, self.busy))
+            return conn
+
+    def release_conn(self, conn):
         with self.mutex:
-            conn = self.idle_connect.get(timeout=self.timeout)
-            if conn not in self.busy_connect:
-                self.busy_connect.add(conn)
-                return conn, (self.release_conn, self)
-            raise RuntimeError('connection is busy! release it first')
+            entry = self.busy_connect.pop(id(conn), None)
+        if entry is None:
+            raise RuntimeError('the connection does not belong to this pool')
 
-    @staticmethod
-    def release_conn(pool, conn):
-        with pool.mutext:
-            pool.idle_connect.put(conn)
-            pool.busy_connct.remove(conn)
+        _, created_at = entry
+        if self.closed or self._expired(created_at):
+            self._discard(conn)
+            return
+        try:
+            # never hand out a connection with a pending transaction
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self.mutex:
+            self.idle_connect.append([conn, created_at, time.monotonic()])
+            self.mutex.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire_conn(timeout)
+        try:
+            yield conn
+        finally:
+            self.release_conn(conn)
+
+    def watch(self):
+        """
+        关闭空闲过久和存活过久的连接，并将连接数补充到`minsize`
+        """
+        now = time.monotonic()
+        evicted = list()
+        with self.mutex:
+            keep = deque()
+            for entry in self.idle_connect:
+                _, created_at, last_used_at = entry
+                idle_too_long = self.max_idle is not None and now - last_used_at > self.max_idle
+                if self._expired(created_at, now) or (idle_too_long and self.size - len(evicted) > self.minsize):
+                    evicted.append(entry[0])
+                else:
+                    keep.append(entry)
+            self.idle_connect = keep
+            self.size -= len(evicted)
+            missing = max(self.minsize - self.size, 0) if not self.closed else 0
+            self.size += missing
+            if evicted:
+                self.mutex.notify(len(evicted))
+
+        for conn in evicted:
+            self._close(conn)
+        self._fill(missing)
+
+    def close(self):
+        with self.mutex:
+            self.closed = True
+            idle = [entry[0] for entry in self.idle_connect]
+            self.idle_connect.clear()
+            self.size -= len(idle)
+            busy = len(self.busy_connect)
+            self.mutex.notify_all()
+        self.stop_event.set()
+        for conn in idle:
+            self._close(conn)
+        if busy != 0:
+            logging.critical('some connection are still working, but the pool was closed')
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.watch_dog.cancel()
-        while not self.idle_connect.empty():
-            fr = self.idle_connect.get()
-            fr.close()
+        self.close()
 
-        if len(self.busy_connect) != 0:
-            logging.critical('some connection are still working, but the pool was closed')
-        for conn in list(self.busy_connect):
+    def _watch_loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.watch()
+            except Exception:
+                logging.exception('pool watch dog failed')
+
+    def _fill(self, n):
+        # `self.size` must already include the `n` connections
+        for i in range(n):
+            try:
+                conn = self.create_a_connect()
+            except Exception:
+                self._forget(n - i)
+                logging.exception('failed to create connection for pool')
+                return
+            with self.mutex:
+                self.idle_connect.appendleft([conn, time.monotonic(), time.monotonic()])
+                self.mutex.notify()
+
+    def _expired(self, created_at, now=None):
+        if self.max_lifetime is None:
+            return False
+        return (now or time.monotonic()) - created_at > self.max_lifetime
+
+    @staticmethod
+    def _close(conn):
+        try:
             conn.close()
+        except Exception:
+            pass
+
+    def _forget(self, n):
+        with self.mutex:
+            self.size -= n
+            self.mutex.notify(n)
+
+    def _discard(self, conn):
+        self._close(conn)
+        self._forget(1)
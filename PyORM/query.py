@@ -1,5 +1,45 @@
-from PyORM.sql import sql_map
-from PyORM.utils import execute_sql
+import json
+import heapq
+import base64
+import warnings
+import datetime
+import threading
+import contextvars
+from types import GeneratorType
+from functools import cmp_to_key, partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from itertools import chain, islice, count
+from contextlib import closing, ExitStack
+from PyORM.session import Session
+from PyORM.fields import NoneValue
+from PyORM.expression import Expression, Clause, Ordering, Comparison, In
+from PyORM.cache import LRUCache, ResultCache
+from PyORM.relationship import LoadContext
+from PyORM.dialect import dialect_of
+from PyORM.utils import execute_sql, stream_sql
+
+
+class FullScanWarning(UserWarning):
+    """
+    带条件的查询在数据库中进行了全表扫描，通常意味着条件中的字段缺少索引
+    """
+
+
+def encode_cursor(values) -> str:
+    """
+    将分页游标（最后一条记录的排序键）编码为字符串
+    """
+    def default(value):
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat(sep=' ') if isinstance(value, datetime.datetime) else value.isoformat()
+        raise TypeError(f'can not encode {type(value)} in cursor')
+
+    data = json.dumps(list(values), default=default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(token: str) -> list:
+    return json.loads(base64.urlsafe_b64decode(token.encode()))
 
 
 class QueryDescriptor:
@@ -11,45 +51,825 @@ class QueryDescriptor:
 
 
 class Query:
-    def __init__(self, model_class, bind=None):
+    shapes = ('models', 'tuples', 'dicts', 'namedtuples')
+
+    # development only: EXPLAIN every statement with a WHERE clause and
+    # emit FullScanWarning when it scans the whole table; this turns it on for every query,
+    # `Session(check_full_scan=True)` only for the queries bound to that session
+    check_full_scan = False
+    _explained = LRUCache(maxsize=1024)
+    # used by `cache()` when the model has no `__cache__`
+    default_cache = ResultCache(maxsize=1024)
+    # threads shared by every `gather()`, created on first use
+    gather_workers = 16
+    _gather_executor = None
+    _gather_lock = threading.Lock()
+    _gather_local = threading.local()
+
+    def __init__(
+            self,
+            model_class,
+            bind=None,
+            shape=None,
+            criteria=(),
+            columns=None,
+            ordering=(),
+            limit=None,
+            offset=None,
+            cache=None,
+            cache_ttl=None,
+            load=(),
+            eager=True,
+    ):
+        """
+        Query是不可变的，filter()、only()、order_by()等方法都返回新的Query
+        :param bind: 数据库连接或Session。绑定Session时使用当前上下文的连接，
+                     查询得到的实例经过Session的identity map，同一条记录只对应一个实例
+        :param shape: 结果的形式，models、tuples、dicts或namedtuples；
+                      None时filter_by()、all()、iter()返回实例，select_all()返回元组
+        :param criteria: 查询条件，多个条件之间为AND
+        :param columns: 查询的字段，None表示全部字段
+        :param ordering: ORDER BY的各项
+        :param cache: 缓存查询结果的ResultCache，None时使用表单类的`__cache__`，False表示不缓存
+        :param cache_ttl: 本查询缓存项的存活秒数，None时使用ResultCache的默认值
+        :param load: 随查询一起加载的关联属性
+        :param eager: 为False时不自动加载lazy=False的关联属性（加载关联记录的查询使用，避免循环加载）
+        """
+        if shape is not None and shape not in self.shapes:
+            raise ValueError(f'unknown result shape: {shape}')
         self.model_class = model_class
         self.bind = bind
+        self.shape = shape
+        self._criteria = tuple(criteria)
+        self._columns = columns
+        self._ordering = tuple(ordering)
+        self._limit = limit
+        self._offset = offset
+        self._cache = cache
+        self._cache_ttl = cache_ttl
+        self._load = tuple(load)
+        self._eager = eager
 
     def __call__(self, bind):
-        cls = self.__class__
-        return cls(model_class=self.model_class, bind=bind)
+        return self._clone(bind=bind)
+
+    def _clone(self, **kwargs):
+        params = dict(
+            model_class=self.model_class,
+            bind=self.bind,
+            shape=self.shape,
+            criteria=self._criteria,
+            columns=self._columns,
+            ordering=self._ordering,
+            limit=self._limit,
+            offset=self._offset,
+            cache=self._cache,
+            cache_ttl=self._cache_ttl,
+            load=self._load,
+            eager=self._eager,
+        )
+        params.update(kwargs)
+        return self.__class__(**params)
+
+    def as_models(self):
+        return self._clone(shape='models')
+
+    def as_tuples(self):
+        """
+        结果为原始元组，不构造任何对象
+        """
+        return self._clone(shape='tuples')
+
+    def as_dicts(self):
+        return self._clone(shape='dicts')
+
+    def as_namedtuples(self):
+        return self._clone(shape='namedtuples')
+
+    def filter(self, *expressions):
+        """
+        :param expressions: 字段表达式，如 Student.age >= 18, Student.username.like('l%')，
+                            多个表达式之间为AND，可以用 & | ~ 组合
+        """
+        for each in expressions:
+            if not isinstance(each, Expression):
+                raise TypeError(f'filter() expects field expressions, got {type(each)}')
+        return self._clone(criteria=self._criteria + expressions)
+
+    def only(self, *fields):
+        """
+        只查询指定的字段，未查询的字段在实例中为`NoneValue`
+        :param fields: 字段或字段名
+        """
+        return self._clone(columns=tuple(self._field(each).field_name for each in fields))
+
+    def undefer(self, *fields):
+        """
+        同时查询延迟加载的字段，而不是在第一次访问时再查询
+        :param fields: 字段或字段名，不提供时为全部延迟加载的字段
+        """
+        names = {self._field(each).field_name for each in fields} or set(self.model_class.__deferred__)
+        columns = set(self._fields()) | names
+        return self._clone(columns=tuple(k for k in self.model_class.__kd_map__ if k in columns))
+
+    def order_by(self, *orderings):
+        """
+        :param orderings: 字段（升序）、Student.age.desc()，或字段名（'-age'表示降序）
+        """
+        items = list()
+        for each in orderings:
+            if isinstance(each, str) and each.startswith('-'):
+                each = self._field(each[1:]).desc()
+            elif not isinstance(each, Ordering):
+                each = self._field(each).asc()
+            items.append(each)
+        return self._clone(ordering=self._ordering + tuple(items))
+
+    def load(self, *relationships):
+        """
+        随查询一起加载关联属性：每个关联属性只多一次 WHERE fk IN (...) 查询，而不是每条记录一次
+        :param relationships: 关联属性名，'scores.course'表示继续加载scores中每条记录的course
+        """
+        for path in relationships:
+            model_class = self.model_class
+            for name in path.split('.'):
+                relationship = model_class.__relationships__.get(name)
+                if relationship is None:
+                    raise AttributeError(f'{model_class.__name__} has no relationship `{name}`')
+                model_class = relationship.resolve()[0]
+        return self._clone(load=self._load + relationships)
+
+    def cache(self, ttl=None, store=None):
+        """
+        缓存本查询的结果，以(sql, 参数)为键；`Session.commit()`写入该表后自动失效
+        :param ttl: 缓存项的存活秒数
+        :param store: 使用的ResultCache，默认为表单类的`__cache__`或`Query.default_cache`
+        """
+        if store is None:
+            store = self.model_class.__cache__
+        if store is None:
+            store = self.default_cache
+        return self._clone(cache=store, cache_ttl=ttl)
+
+    def no_cache(self):
+        """
+        不使用表单类的`__cache__`，总是查询数据库
+        """
+        return self._clone(cache=False)
+
+    @property
+    def result_cache(self):
+        """
+        :return: 本查询使用的ResultCache，不缓存时为None；命中次数见`result_cache.stats()`
+        """
+        if self._cache is None:
+            return self.model_class.__cache__
+        return self._cache if self._cache is not False else None
+
+    def limit(self, n):
+        return self._clone(limit=int(n))
+
+    def offset(self, n):
+        return self._clone(offset=int(n))
+
+    @property
+    def session(self):
+        return self.bind if isinstance(self.bind, Session) else None
+
+    @property
+    def connection(self):
+        # queries read from a replica when the session has them
+        if isinstance(self.bind, Session):
+            return self.bind.read_connection
+        return self.bind
 
     def execute(self, sql, values=None):
-        return execute_sql(self.bind, sql, values)
+        store = self.result_cache
+        if store is None:
+            return self._execute(sql, values)
 
-    def select_all(self):
-        sql = sql_map['__select_all__'].format(table_name=self.model_class.table_name)
-        return self.execute(sql)
+        # the cache is shared by every database, the same statement has different rows in each
+        key = (self._database_key(), sql, values)
+        rows = store.get(key)
+        if rows is None:
+            table = self.model_class.table_name
+            generation = store.generation(table)
+            rows = tuple(self._execute(sql, values))
+            store.set(key, rows, table, self._cache_ttl, generation)
+        return rows
+
+    def _database_key(self):
+        session = self.session
+        if session is not None:
+            return session.database_key
+        # a plain connection is only known by itself
+        return 'connection', id(self.bind)
+
+    def _execute(self, sql, values=None):
+        shards = self._shards()
+        if self._checks_full_scan():
+            self._check_full_scan(sql, values, shards)
+        if shards is not None:
+            return self._execute_shards(shards, sql, values)
+        return execute_sql(self.connection, sql, values)
+
+    def _checks_full_scan(self) -> bool:
+        session = self.session
+        return self.check_full_scan or (session is not None and session.check_full_scan)
+
+    def _check_full_scan(self, sql, values, shards=None):
+        if ' WHERE ' not in sql or self._explained.get(sql) is not None:
+            return
+        self._explained.set(sql, True)
+        if shards:
+            connection = self.session.shard_connection(shards[0])
+        elif shards is None:
+            connection = self.connection
+        else:
+            return
+        for table in dialect_of(connection).full_scans(connection, sql, values):
+            warnings.warn(f'full table scan on `{table}` for sql: {sql}', FullScanWarning, stacklevel=4)
+
+    def all(self) -> list:
+        """
+        :return: 满足全部条件的记录，默认为表单类的实例
+        """
+        sql, values = self._select_statement()
+        return self._results(self.execute(sql, values))
 
-    @classmethod
-    def filter(cls):
-        pass
+    def first(self):
+        """
+        :return: 第一条记录，没有时返回None
+        """
+        result = self.limit(1).all()
+        return result[0] if result else None
+
+    def select_all(self):
+        """
+        :return: 满足当前条件的全部记录，默认为原始元组
+        """
+        sql, values = self._select_statement()
+        return self._results(self.execute(sql, values), default='tuples')
 
     def filter_by(self, **kwargs) -> list:
         """
-        filter_by() 只支持`=`(等号)判等运算
+        filter_by() 只支持`=`(等号)判等运算，多个条件之间为AND
         :param kwargs: 查询条件
         :return: 返回满足条件的记录构成的列表
         """
         if not kwargs:
             raise RuntimeError('**kwargs is required')
 
-        sql_template = sql_map['__select__'].format(
-            table_name=self.model_class.table_name,
-            condition=','.join([f'{k}={"%s"}' for k in kwargs.keys()])
+        query = self._where(kwargs)
+        sql, values = query._select_statement()
+        records = query.execute(sql, values)
+        return query._results(records)
+
+    def get(self, primary_key_value):
+        """
+        按primary key查找一条记录，绑定Session时优先从identity map中获取
+        :return: 表单类的实例，不存在时返回None
+        """
+        return self.get_many([primary_key_value])[0]
+
+    def get_many(self, primary_key_values, chunk_size=1000) -> list:
+        """
+        按primary key查找多条记录，identity map中没有的记录用 WHERE pk IN (...) 一次查询
+        :return: 与`primary_key_values`一一对应的实例列表，不存在的记录为None
+        """
+        model_class = self.model_class
+        if not model_class.__primary_key__:
+            raise RuntimeError(f'{model_class.__name__} has no primary key')
+
+        session = self.session
+        identity = session.identity_map if session is not None else dict()
+        found = dict()
+        missing = list()
+        for value in primary_key_values:
+            record = identity.get((model_class, value))
+            if record is not None:
+                found[value] = record
+            else:
+                missing.append(value)
+
+        missing = list(dict.fromkeys(missing))
+        primary_key = model_class.__kd_map__[model_class.__primary_key__]
+        query = self._clone(shape='models', criteria=(), columns=None, ordering=(), limit=None, offset=None)
+        for i in range(0, len(missing), chunk_size):
+            for record in query.filter(primary_key.in_(missing[i:i + chunk_size])).all():
+                found[getattr(record, primary_key.field_name)] = record
+        return [found.get(value) for value in primary_key_values]
+
+    def page(self, page_size, after=None, order_by=None):
+        """
+        基于排序键的分页（keyset pagination）：WHERE key > last_seen ORDER BY key LIMIT page_size，
+        无论翻到第几页都只扫描page_size行，不会像OFFSET一样越翻越慢
+        :param page_size: 每页的记录数
+        :param after: 上一页返回的游标，也可以直接提供排序键的值；None表示第一页
+        :param order_by: 排序键，一个或多个字段（或字段名），组合起来必须唯一，默认为primary key
+        :return: (本页的记录, 下一页的游标)，没有下一页时游标为None
+        """
+        keys = self._keyset(order_by)
+        fields = self._fields()
+        for key in keys:
+            if key.field_name not in fields:
+                raise RuntimeError(f'keyset column `{key.field_name}` must be selected')
+
+        query = self._clone(ordering=tuple(key.asc() for key in keys), limit=int(page_size), offset=None)
+        if after is not None:
+            if isinstance(after, str):
+                values = decode_cursor(after)
+            elif isinstance(after, (tuple, list)):
+                values = list(after)
+            else:
+                values = [after]
+            if len(values) != len(keys):
+                raise ValueError(f'cursor has {len(values)} values, expect {len(keys)}')
+            query = query.filter(self._after(keys, values))
+
+        sql, values = query._select_statement()
+        rows = query.execute(sql, values)
+        token = None
+        if rows and len(rows) >= page_size:
+            last = rows[-1]
+            token = encode_cursor(last[fields.index(key.field_name)] for key in keys)
+        return query._results(rows), token
+
+    def iter_pages(self, page_size, order_by=None, after=None):
+        """
+        逐页产生记录列表，每页一次keyset查询，适合遍历大表
+        """
+        while True:
+            records, after = self.page(page_size, after, order_by)
+            if records:
+                yield records
+            if after is None:
+                return
+
+    def iter(self, chunk_size=1000, raw=False, **kwargs):
+        """
+        流式查询，逐条产生记录，每次从服务端读取`chunk_size`行
+        :param raw: 为True时产生原始的元组，否则按`shape`产生结果（默认为表单类的实例）
+        :param kwargs: 与filter_by()相同的查询条件，与filter()的条件之间为AND
+        """
+        chunks = self.yield_per(chunk_size, raw, **kwargs)
+        try:
+            for chunk in chunks:
+                yield from chunk
+        finally:
+            chunks.close()
+
+    def yield_per(self, n, raw=False, **kwargs):
+        """
+        流式查询，每次产生不超过`n`条记录构成的列表
+        中途停止迭代（break、异常或调用close()）时会关闭服务端游标。
+        数据库的流式游标没有缓冲时（mysql的SSCursor），读完之前同一个连接上不能执行其他语句：
+        绑定Session并产生表单类的实例时，结果从`Session.stream_connection()`借出的单独连接读取，
+        迭代过程中加载关联和延迟加载的字段使用当前上下文的连接，不会截断未读完的结果；
+        绑定连接时迭代过程中在这个连接上执行语句（`load()`、lazy=False的关联和延迟加载的字段）会抛出RuntimeError。
+        sqlite的游标互不影响，流式读取总是使用当前上下文的连接
+        """
+        query = self._where(kwargs)
+        sql, values = query._select_statement()
+        shards = query._shards()
+        if self._checks_full_scan():
+            query._check_full_scan(sql, values, shards)
+        if shards is not None:
+            chunks = query._stream_shards(shards, n, query._own_stream(raw))
+        elif query._own_stream(raw):
+            chunks = query._stream_own(sql, values, n)
+        else:
+            chunks = stream_sql(query.connection, sql, values, n)
+        with closing(chunks):
+            for rows in chunks:
+                yield rows if raw else query._results(rows)
+
+    def to_columns(self, chunk_size=1000, **kwargs) -> dict:
+        """
+        按列返回查询结果，流式读取，不构造表单类的实例
+        :param kwargs: 与filter_by()相同的查询条件
+        :return: 字段名 -> 该列全部值的列表
+        """
+        columns = {name: list() for name in self._fields()}
+        lists = tuple(columns.values())
+        for rows in self.yield_per(chunk_size, raw=True, **kwargs):
+            for column, values in zip(lists, zip(*rows)):
+                column.extend(values)
+        return columns
+
+    def to_numpy(self, chunk_size=10000, **kwargs) -> dict:
+        """
+        按列返回numpy数组，每读取一批就转换为数组，需要安装numpy。
+        dtype由字段类型决定：Integer为int64，Double为float64，Boolean为bool，
+        Date为datetime64[D]，DateTime/TimeStamp为datetime64[s]，其余为object；
+        含NULL的Integer列为float64（NULL为nan），含NULL的Boolean列为object
+        :return: 字段名 -> numpy数组
+        """
+        import numpy
+
+        fields = [self.model_class.__kd_map__[name] for name in self._fields()]
+        chunks = [list() for _ in fields]
+        for rows in self.yield_per(chunk_size, raw=True, **kwargs):
+            for field, chunk, values in zip(fields, chunks, zip(*rows)):
+                chunk.append(self._array(numpy, field.dtype, values))
+        return {
+            field.field_name: numpy.concatenate(chunk) if chunk else numpy.array([], dtype=field.dtype or object)
+            for field, chunk in zip(fields, chunks)
+        }
+
+    @staticmethod
+    def _array(numpy, dtype, values: tuple):
+        if dtype in ('int64', 'bool') and None in values:
+            # NULL has no int64 or bool representation
+            if dtype == 'int64':
+                return numpy.array([numpy.nan if value is None else value for value in values], dtype='float64')
+            dtype = None
+        if dtype is not None:
+            try:
+                return numpy.array(values, dtype=dtype)
+            except (TypeError, ValueError, OverflowError):
+                # e.g. BIGINT UNSIGNED beyond int64
+                pass
+        # filled item by item, so that tuple values do not become a second dimension
+        array = numpy.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    @staticmethod
+    def gather(*operations, pool=None, max_workers=None, timeout=None) -> list:
+        """
+        在线程池中并发执行多个互不相关的查询，每个查询使用自己的连接，总耗时接近最慢的一个，而不是全部之和：
+            adults, rows, girls = Query.gather(
+                Student.query(db.session).filter(Student.age >= 18),     # Query，执行all()
+                Score.query(db.session).select_all,                      # Query的方法
+                partial(Student.query(db.session).filter_by, sex=True),  # 带参数的Query方法
+            )
+        绑定Session的查询各自在一个新的上下文中执行，从Session的连接池借出连接（没有连接池时为`Session.shared_pool`），
+        结束后归还；新的上下文继承调用方最近一次写入的时间，刚提交过的写入仍从主库读取，
+        得到的实例不进入调用方上下文的identity map。绑定连接或未绑定的查询，以及其余函数（以借出的连接为参数调用）使用`pool`。
+        全部gather共用有`gather_workers`个线程的线程池
+        :param pool: 借出连接的连接池，提供时全部查询都使用它
+        :param max_workers: 最多同时执行的查询数，默认为`gather_workers`，不超过查询的个数和所用连接池的maxsize
+        :param timeout: 等待全部结果的秒数，超时抛出TimeoutError
+        :return: 与`operations`顺序一致的结果
+        """
+        if not operations:
+            return []
+        calls, pools = zip(*(Query._gather_call(each, pool) for each in operations))
+        if getattr(Query._gather_local, 'active', False):
+            # a gather inside a gather worker could wait for the very threads it occupies
+            return [call() for call in calls]
+        workers = min(len(calls), max_workers or Query.gather_workers, *(each.maxsize for each in pools))
+
+        # each worker takes the next operation until none is left, or one of them failed
+        results, finished = [None] * len(calls), [False] * len(calls)
+        indexes, stop = count(), threading.Event()
+
+        def work():
+            Query._gather_local.active = True
+            try:
+                while not stop.is_set():
+                    i = next(indexes)
+                    if i >= len(calls):
+                        return
+                    try:
+                        results[i] = calls[i]()
+                    except BaseException as e:
+                        stop.set()
+                        raise e
+                    finished[i] = True
+            finally:
+                Query._gather_local.active = False
+
+        executor = Query._executor()
+        futures = [executor.submit(work) for _ in range(workers)]
+        done, pending = wait(futures, timeout, return_when=FIRST_EXCEPTION)
+        failed = [future for future in futures if future in done and future.exception() is not None]
+        if failed or pending:
+            # running queries finish in the background and return their connections
+            stop.set()
+            for future in pending:
+                future.cancel()
+        if failed:
+            raise failed[0].exception()
+        if pending:
+            raise TimeoutError(f'{finished.count(False)} of {len(calls)} queries did not finish in {timeout}s')
+        return results
+
+    @staticmethod
+    def _executor() -> ThreadPoolExecutor:
+        with Query._gather_lock:
+            if Query._gather_executor is None:
+                Query._gather_executor = ThreadPoolExecutor(
+                    max_workers=Query.gather_workers, thread_name_prefix='PyORM-gather'
+                )
+        return Query._gather_executor
+
+    @staticmethod
+    def _gather_call(operation, pool):
+        """
+        :return: (在工作线程中执行`operation`的无参数函数, 它借出连接的连接池)
+        """
+        query, method, args, kwargs = None, 'all', (), dict()
+        if isinstance(operation, Query):
+            query = operation
+        else:
+            func = operation
+            if isinstance(operation, partial):
+                func, args, kwargs = operation.func, operation.args, operation.keywords
+            if isinstance(getattr(func, '__self__', None), Query):
+                query, method = func.__self__, func.__name__
+
+        if query is not None and query.session is not None:
+            session = query.session
+            pool = pool or session.shared_pool
+            # a fresh context that only keeps when the caller last wrote, for read-your-writes
+            context = contextvars.Context()
+            written = session.getitem('written', None)
+            if written is not None:
+                context.run(session.setitem, 'written', written)
+            return partial(context.run, Query._run_in_session, query, pool, method, args, kwargs), pool
+
+        if pool is None:
+            raise RuntimeError(f'gather() requires a pool to run {operation!r}')
+
+        def call():
+            with pool.connection() as conn:
+                if query is None:
+                    result = operation(conn)
+                else:
+                    result = getattr(query(conn), method)(*args, **kwargs)
+                # generators have to be consumed before the connection is returned
+                return list(result) if isinstance(result, GeneratorType) else result
+        return call, pool
+
+    @staticmethod
+    def _run_in_session(query, pool, method, args, kwargs):
+        session = query.session
+        conn = None
+        if pool is not session.pool:
+            # the session itself takes connections from its own pool only when it needs them
+            conn = pool.acquire_conn()
+            session.setitem('connect', conn)
+        try:
+            result = getattr(query, method)(*args, **kwargs)
+            return list(result) if isinstance(result, GeneratorType) else result
+        finally:
+            if conn is not None:
+                session.setitem('connect', None)
+            session.close()
+            if conn is not None:
+                pool.release_conn(conn)
+
+    def _where(self, conditions):
+        """
+        :param conditions: filter_by()形式的等值条件
+        :return: 加上这些条件的Query
+        """
+        if not conditions:
+            return self
+        return self.filter(*(self._field(k) == v for k, v in conditions.items()))
+
+    def _shards(self):
+        """
+        :return: 查询需要访问的分片序号，条件中有分片键的等值或IN条件时只访问对应的分片；
+                 表单类没有分片或Session没有配置分片时为None
+        """
+        shard_map = self.model_class.__shard_map__
+        session = self.session
+        if shard_map is None or session is None or session.shards is None:
+            return None
+        key = self.model_class.__kd_map__[self.model_class.__shard_key__]
+        shards = set(range(shard_map.size))
+        expressions = list(self._criteria)
+        while expressions:
+            expression = expressions.pop()
+            if isinstance(expression, Clause) and expression.operator == 'AND':
+                expressions.extend(expression.expressions)
+            elif isinstance(expression, Comparison) and expression.field is key and expression.operator == '=':
+                shards &= {shard_map.shard_of(expression.value)}
+            elif isinstance(expression, In) and expression.field is key and not expression.negate:
+                shards &= {shard_map.shard_of(value) for value in expression.values}
+        return sorted(shards)
+
+    def _shard_query(self):
+        """
+        :return: 在每个分片上执行的Query：每个分片返回前offset + limit行，合并排序后再截取
+        """
+        if self._limit is None and self._offset is None:
+            return self
+        limit = None if self._limit is None else self._limit + (self._offset or 0)
+        return self._clone(limit=limit, offset=None)
+
+    def _execute_shards(self, shards, sql, values):
+        session = self.session
+        connections = [session.shard_connection(shard) for shard in shards]
+        if len(connections) <= 1:
+            return execute_sql(connections[0], sql, values) if connections else ()
+
+        sql, values = self._shard_query()._select_statement()
+        results = session.shards.map(lambda connection: execute_sql(connection, sql, values), connections)
+        rows = list(chain.from_iterable(results))
+        if self._ordering:
+            rows.sort(key=self._order_key())
+        if self._limit is not None or self._offset is not None:
+            start = self._offset or 0
+            rows = rows[start:None if self._limit is None else start + self._limit]
+        return rows
+
+    def _own_stream(self, raw) -> bool:
+        """
+        :return: 流式读取是否使用单独的连接：流式游标没有缓冲，并且绑定Session、产生表单类的实例，
+                 迭代中可能要加载关联和延迟加载的字段
+        """
+        session = self.session
+        return (
+            session is not None and not session.dialect.buffered_stream
+            and not raw and (self.shape or 'models') == 'models'
         )
 
-        records = self.execute(sql_template, tuple(kwargs.values()))
+    def _stream_own(self, sql, values, n):
+        with self.session.stream_connection() as connection:
+            yield from stream_sql(connection, sql, values, n)
 
-        result = list()
+    def _stream_shards(self, shards, n, own=False):
+        """
+        流式读取多个分片，有排序时按排序键归并各分片的结果
+        :param own: 从各分片借出单独的连接，而不是使用当前上下文的分片连接
+        """
+        session = self.session
+        sql, values = self._shard_query()._select_statement()
+        with ExitStack() as stack:
+            if own:
+                connections = [stack.enter_context(session.stream_connection(shard)) for shard in shards]
+            else:
+                connections = [session.shard_connection(shard) for shard in shards]
+            streams = [stack.enter_context(closing(stream_sql(connection, sql, values, n))) for connection in connections]
+            rows = [chain.from_iterable(stream) for stream in streams]
+            rows = heapq.merge(*rows, key=self._order_key()) if self._ordering else chain.from_iterable(rows)
+            if self._limit is not None or self._offset is not None:
+                start = self._offset or 0
+                rows = islice(rows, start, None if self._limit is None else start + self._limit)
+            while True:
+                chunk = list(islice(rows, n))
+                if not chunk:
+                    return
+                yield chunk
+
+    def _order_key(self):
+        """
+        :return: 在Python中按ORDER BY比较行的key函数，NULL与mysql一样视为最小值
+        """
+        fields = self._fields()
+        orders = list()
+        for ordering in self._ordering:
+            name = ordering.field.field_name
+            if name not in fields:
+                raise RuntimeError(f'a query across shards can only order by selected columns, `{name}` is not selected')
+            orders.append((fields.index(name), ordering.descending))
+
+        def compare(a, b):
+            for i, descending in orders:
+                x, y = (a[i] is not None, a[i]), (b[i] is not None, b[i])
+                if x != y:
+                    return (1 if x > y else -1) * (-1 if descending else 1)
+            return 0
+
+        return cmp_to_key(compare)
+
+    def _field(self, field):
+        kd_map = self.model_class.__kd_map__
+        name = field if isinstance(field, str) else getattr(field, 'field_name', None)
+        if name not in kd_map or (not isinstance(field, str) and kd_map[name] is not field):
+            raise AttributeError(f'{self.model_class.__name__} has no field {field!r}')
+        return kd_map[name]
+
+    def _keyset(self, order_by) -> tuple:
+        if order_by is None:
+            primary_key = self.model_class.__primary_key__
+            if not primary_key:
+                raise RuntimeError(f'{self.model_class.__name__} has no primary key, order_by is required')
+            order_by = (primary_key,)
+        elif not isinstance(order_by, (tuple, list)):
+            order_by = (order_by,)
+        return tuple(self._field(each) for each in order_by)
+
+    @staticmethod
+    def _after(keys, values):
+        # (k1, k2) > (v1, v2)  =>  k1 > v1 OR (k1 = v1 AND k2 > v2), which can use the index on (k1, k2)
+        branches = list()
+        for i, key in enumerate(keys):
+            equals = [keys[j] == values[j] for j in range(i)]
+            branches.append(Clause('AND', *equals, key > values[i]) if equals else key > values[i])
+        return branches[0] if len(branches) == 1 else Clause('OR', *branches)
+
+    def _fields(self) -> tuple:
+        return self._columns or self.model_class.__default_columns__
+
+    def _select_statement(self):
+        """
+        :return: (sql, values)
+        """
+        criteria = self._criteria
+
+        where, values = None, list()
+        if criteria:
+            where, values = (criteria[0] if len(criteria) == 1 else Clause('AND', *criteria)).compile()
+        if self._limit is not None:
+            values.append(self._limit)
+        if self._offset is not None:
+            values.append(self._offset)
+
+        sql = self.model_class.select_statement(
+            columns=self._fields(),
+            where=where,
+            order_by=tuple(each.compile() for each in self._ordering),
+            limit=self._limit is not None,
+            offset=self._offset is not None,
+            # only OFFSET without LIMIT differs between databases
+            dialect=self._dialect() if self._offset is not None and self._limit is None else None,
+        )
+        return sql, tuple(values) or None
+
+    def _dialect(self):
+        # the session knows its dialect without taking a connection
+        session = self.session
+        return session.dialect if session is not None else dialect_of(self.bind)
+
+    def _results(self, rows, default='models'):
+        shape = self.shape or default
+        if shape == 'tuples':
+            return rows if self.shape is None else list(rows)
+        fields = self._fields()
+        if shape == 'models':
+            records = self._hydrate(rows, fields)
+            if self.model_class.__relationships__ or self.model_class.__deferred__:
+                self._load_relationships(records)
+            return records
+        if shape == 'dicts':
+            return [dict(zip(fields, row)) for row in rows]
+        return list(map(self.model_class.row_type(fields)._make, rows))
+
+    def _load_relationships(self, records):
+        # the shared context is also used to load deferred fields
+        context = LoadContext(self.bind, records)
         for record in records:
-            tmp = self.model_class(**dict(zip(self.model_class.__kd_map__.keys(), record)))
-            tmp.read_from_db = True
-            result.append(tmp)
-        return result
+            record._context = context
+        if not records:
+            return
 
+        # relationships named in `load()` are always reloaded, lazy=False ones only when missing
+        paths = dict.fromkeys(self._load, True)
+        if self._eager:
+            for name, each in self.model_class.__relationships__.items():
+                if not each.lazy:
+                    paths.setdefault(name, False)
+        for path, reload in paths.items():
+            batch, model_class = records, self.model_class
+            for name in path.split('.'):
+                relationship = model_class.__relationships__[name]
+                pending = batch if reload else [
+                    each for each in batch if name not in (getattr(each, '_related', None) or ())
+                ]
+                if pending:
+                    relationship.load(pending, self.bind)
+                model_class, many = relationship.resolve()[0], relationship.resolve()[3]
+                loaded = list()
+                for each in batch:
+                    value = each._related[name]
+                    if many:
+                        loaded.extend(value)
+                    elif value is not None:
+                        loaded.append(value)
+                batch = list({id(each): each for each in loaded}.values())
+                if not batch:
+                    break
+
+    def _hydrate(self, rows, fields: tuple) -> list:
+        model_class = self.model_class
+        hydrate = model_class.hydrator(fields)
+        session = self.session
+        primary_key = model_class.__primary_key__
+        # partially loaded instances are kept out of the identity map,
+        # unless only the deferred fields are missing
+        if session is None or not primary_key or not set(model_class.__default_columns__).issubset(fields):
+            return list(map(hydrate, rows))
+
+        # reuse the instance already in the identity map, including its unflushed changes,
+        # and fill in the fields it has not loaded yet
+        identity = session.identity_map
+        index = fields.index(primary_key)
+        positions = [(i, model_class.__kd_map__[k].position) for i, k in enumerate(fields)]
+        result = list()
+        for row in rows:
+            key = (model_class, row[index])
+            record = identity.get(key)
+            if record is None:
+                record = hydrate(row)
+                identity[key] = record
+            else:
+                for i, position in positions:
+                    if record._row[position] is NoneValue:
+                        record._row[position] = row[i]
+            result.append(record)
+        return result
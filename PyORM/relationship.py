@@ -0,0 +1,169 @@
+from weakref import ref
+from PyORM.fields import Field, NoneValue
+
+
+class LoadContext:
+    """
+    同一次查询得到的记录共享一个LoadContext，
+    任意一条记录第一次访问关联属性时，为这一批记录一次性加载，避免N+1查询
+    """
+    __slots__ = ('bind', 'records')
+
+    def __init__(self, bind, records):
+        self.bind = bind
+        self.records = [ref(record) for record in records]
+
+    def alive(self) -> list:
+        return [record for record in (each() for each in self.records) if record is not None]
+
+
+def load_column(field, records, bind, chunk_size=1000):
+    """
+    为一批记录加载一个延迟加载的字段：SELECT pk, col FROM ... WHERE pk IN (...)
+    """
+    model_class = field.model
+    primary_key = model_class.__kd_map__[model_class.__primary_key__]
+    by_key = {record._row[primary_key.position]: record for record in records}
+    keys = list(by_key)
+    query = model_class.query(bind).only(primary_key, field).as_tuples()
+    for i in range(0, len(keys), chunk_size):
+        for key, value in query.filter(primary_key.in_(keys[i:i + chunk_size])).all():
+            by_key[key]._row[field.position] = value
+    # a row deleted in the meantime reads as NULL instead of being queried again
+    for record in records:
+        if record._row[field.position] is NoneValue:
+            record._row[field.position] = None
+
+
+class Relationship:
+    """
+    表单之间的关联属性，由外键字段确定关联方向：
+        class Score(db.Model):
+            student_id = ForeignKey(Student.uid)
+            student = Relationship('Student', 'student_id')      # 多对一，值为Student实例或None
+
+        class Student(db.Model):
+            scores = Relationship('Score', 'student_id')         # 一对多，值为Score实例的列表
+
+    加载方式：
+    - lazy=True: 第一次访问时加载，同一次查询得到的全部记录一起用 WHERE fk IN (...) 加载
+    - lazy=False: 查询表单时总是随查询一起加载，也可以用`query.load('scores')`为单个查询指定
+    """
+    chunk_size = 1000
+
+    def __init__(self, target, foreign_key, lazy=True, many=None):
+        """
+        :param target: 关联的表单类，或表单类的类名、表名（可以引用之后才定义的表单）
+        :param foreign_key: 外键字段或字段名，可以在任意一方
+        :param many: 是否为一对多，默认由外键所在的一方决定；引用自身的表单需要显式指定
+        """
+        self.target = target
+        self.foreign_key = foreign_key
+        self.lazy = lazy
+        self.many = many
+        self.owner = None
+        self.name = None
+        self._resolved = None
+
+    def __set_name__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        related = getattr(instance, '_related', None)
+        if related is not None and self.name in related:
+            return related[self.name]
+
+        context = getattr(instance, '_context', None)
+        if context is None:
+            raise RuntimeError(f'relationship `{self.name}` is not loaded and the record was not read by a query')
+        records = [
+            record for record in context.alive()
+            if self.name not in (getattr(record, '_related', None) or ())
+        ]
+        self.load(records, context.bind)
+        return instance._related[self.name]
+
+    def __set__(self, instance, value):
+        related = getattr(instance, '_related', None)
+        if related is None:
+            related = instance._related = dict()
+        related[self.name] = value
+
+    def resolve(self) -> tuple:
+        """
+        :return: (关联的表单类, 本方的字段, 对方的字段, 是否为一对多)
+        """
+        if self._resolved is not None:
+            return self._resolved
+
+        target = self.target
+        if isinstance(target, str):
+            target = self._find_model(target)
+
+        foreign_key = self.foreign_key
+        if isinstance(foreign_key, str):
+            if foreign_key in target.__kd_map__ and (target is not self.owner or self.many):
+                foreign_key = target.__kd_map__[foreign_key]
+            elif foreign_key in self.owner.__kd_map__:
+                foreign_key = self.owner.__kd_map__[foreign_key]
+            else:
+                raise AttributeError(f'relationship `{self.name}`: unknown foreign key `{foreign_key}`')
+        elif not isinstance(foreign_key, Field):
+            raise TypeError(f'foreign key must be a field or a field name, got {type(foreign_key)}')
+
+        many = self.many
+        if many is None:
+            many = foreign_key.model is not self.owner
+        # the other end of the foreign key, usually the primary key
+        referenced = self.owner if many else target
+        column = foreign_key.references[1] if hasattr(foreign_key, 'references') else referenced.__primary_key__
+        if column not in referenced.__kd_map__:
+            raise AttributeError(f'relationship `{self.name}`: {referenced.__name__} has no field `{column}`')
+        column = referenced.__kd_map__[column]
+
+        if many:
+            self._resolved = (target, column, foreign_key, True)
+        else:
+            self._resolved = (target, foreign_key, column, False)
+        return self._resolved
+
+    def load(self, records, bind) -> list:
+        """
+        为一批记录一次性加载关联的记录（每`chunk_size`个键一次 WHERE ... IN 查询）
+        :return: 加载到的全部关联记录
+        """
+        target, local, remote, many = self.resolve()
+        position = local.position
+        keys = list(dict.fromkeys(
+            record._row[position] for record in records
+            if record._row[position] is not NoneValue and record._row[position] is not None
+        ))
+
+        groups, loaded = dict(), list()
+        # lazy=False relationships of the loaded records are not followed, so two
+        # models referring to each other can not load back and forth forever
+        query = target.query(bind)._clone(eager=False)
+        for i in range(0, len(keys), self.chunk_size):
+            for each in query.filter(remote.in_(keys[i:i + self.chunk_size])).all():
+                groups.setdefault(each._row[remote.position], []).append(each)
+                loaded.append(each)
+
+        for record in records:
+            children = groups.get(record._row[position], [])
+            self.__set__(record, list(children) if many else (children[0] if children else None))
+        return loaded
+
+    def _find_model(self, name):
+        from PyORM.orm import Model
+
+        # walk every model class defined so far, matching the class name or the table name
+        stack = list(Model.__subclasses__())
+        while stack:
+            cls = stack.pop()
+            if cls.__name__ == name or getattr(cls, 'table_name', None) == name:
+                return cls
+            stack.extend(cls.__subclasses__())
+        raise AttributeError(f'relationship `{self.name}`: unknown model `{name}`')
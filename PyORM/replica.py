@@ -0,0 +1,52 @@
+import logging
+from itertools import count
+
+
+class ReplicaSet:
+    """
+    只读副本，每个副本一个连接池，取连接时按`policy`选择副本：
+    - 'round_robin': 依次轮流
+    - 'least_busy': 借出连接最少的副本，相同时轮流
+    选中的副本不可用（连接失败、连接池用尽）时依次尝试其余副本
+    """
+    policies = ('round_robin', 'least_busy')
+
+    def __init__(self, pools, policy='round_robin'):
+        """
+        :param pools: 各副本的连接池
+        """
+        if policy not in self.policies:
+            raise ValueError(f'unknown replica policy: {policy}')
+        if not pools:
+            raise ValueError('require at least one replica')
+        self.pools = list(pools)
+        self.policy = policy
+        self.counter = count()
+
+    def order(self) -> list:
+        """
+        :return: 本次取连接时依次尝试的连接池
+        """
+        start = next(self.counter) % len(self.pools)
+        pools = self.pools[start:] + self.pools[:start]
+        if self.policy == 'least_busy':
+            # sorted() is stable, replicas equally busy keep the round robin order
+            pools.sort(key=lambda pool: pool.busy)
+        return pools
+
+    def acquire_conn(self):
+        """
+        :return: (连接池, 连接)，连接用完后归还给这个连接池
+        """
+        error = None
+        for pool in self.order():
+            try:
+                return pool, pool.acquire_conn()
+            except Exception as e:
+                logging.warning('replica %s is unavailable: %r', pool.config.get('host'), e)
+                error = e
+        raise error
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
@@ -1,33 +1,221 @@
+import time
 import logging
+from itertools import chain
+from threading import Lock
+from collections import namedtuple
+from contextlib import contextmanager
+from weakref import WeakValueDictionary
 from contextvars import ContextVar
 from PyORM.fields import NoneValue
-from PyORM.utils import create_engine
+from PyORM.utils import batches, execute_statements, execute_transactions, tsv_chunks
+from PyORM.dialect import get_dialect
+from PyORM.pool import Pool
 from PyORM.sql import sql_map
+from PyORM.cache import invalidate
+
+# result of `Session.bulk_load()`
+BulkLoadResult = namedtuple('BulkLoadResult', ('rows', 'warnings'))
 
 
 class Session:
-    __slots__ = ('__local', '__config')
+    __slots__ = (
+        '__local', '__config', '__pool', '__dialect', '__max_batch_rows', '__max_batch_bytes', '__update_strategy',
+        '__replicas', '__sticky_seconds', '__shards', '__shared_pool', '__lock', '__check_full_scan',
+    )
 
-    def __init__(self, config: dict):
+    def __init__(
+            self,
+            config: dict,
+            max_batch_rows=1000,
+            max_batch_bytes=1024 * 1024,
+            update_strategy='case',
+            pool=None,
+            dialect='mysql',
+            replicas=None,
+            sticky_seconds=5.0,
+            shards=None,
+            check_full_scan=False,
+    ):
+        """
+        :param config: 数据库连接参数
+        :param pool: 连接池，提供时每个上下文从连接池中取出连接，`close()`时归还，而不是新建连接
+        :param max_batch_rows: 一条批量语句（多行INSERT、CASE UPDATE、IN DELETE）最多包含的行数
+        :param max_batch_bytes: 一条批量语句参数的估算字节数上限，应小于mysql的`max_allowed_packet`
+        :param update_strategy: 批量更新的方式，'case' 或 'executemany'
+        :param dialect: 数据库，'mysql'、'sqlite'或Dialect实例
+        :param replicas: 只读副本（ReplicaSet），提供时查询从副本读取，写操作仍使用主库
+        :param sticky_seconds: 上下文提交写操作后，在这段时间内的查询仍从主库读取，保证读到自己的写入
+        :param shards: 分片数据库（ShardSet），声明了`shard_map`的表单类的读写按分片键路由到各分片
+        :param check_full_scan: 绑定这个Session的查询第一次执行前先EXPLAIN，全表扫描时发出FullScanWarning，仅用于开发环境
+        """
+        if update_strategy not in ('case', 'executemany'):
+            raise ValueError(f'unknown update strategy: {update_strategy}')
         object.__setattr__(self, '_Session__local', ContextVar("db_session"))
         object.__setattr__(self, '_Session__config', config)
-        self.setitem('connect', self.create_new_engine())
+        object.__setattr__(self, '_Session__max_batch_rows', max_batch_rows)
+        object.__setattr__(self, '_Session__max_batch_bytes', max_batch_bytes)
+        object.__setattr__(self, '_Session__update_strategy', update_strategy)
+        object.__setattr__(self, '_Session__pool', pool)
+        object.__setattr__(self, '_Session__dialect', get_dialect(dialect))
+        object.__setattr__(self, '_Session__replicas', replicas)
+        object.__setattr__(self, '_Session__sticky_seconds', sticky_seconds)
+        object.__setattr__(self, '_Session__shards', shards)
+        object.__setattr__(self, '_Session__shared_pool', None)
+        object.__setattr__(self, '_Session__lock', Lock())
+        object.__setattr__(self, '_Session__check_full_scan', check_full_scan)
+        if pool is None:
+            self.setitem('connect', self.create_new_engine())
 
     def create_new_engine(self):
-        return create_engine(**self.__config)
+        return self.__dialect.connect(**self.__config)
+
+    @property
+    def pool(self):
+        return self.__pool
+
+    @property
+    def dialect(self):
+        return self.__dialect
+
+    @property
+    def database_key(self) -> tuple:
+        """
+        :return: 主库的key，见`Dialect.database_key()`
+        """
+        return self.__dialect.database_key(self.__config if self.__pool is None else self.__pool.config)
+
+    @property
+    def check_full_scan(self) -> bool:
+        return self.__check_full_scan
+
+    @property
+    def shared_pool(self):
+        """
+        借出额外连接（流式读取、`Query.gather()`）的连接池：配置了连接池时就是它，
+        否则第一次使用时创建一个，连接由`create_new_engine()`创建
+        """
+        if self.__pool is not None:
+            return self.__pool
+        with self.__lock:
+            if self.__shared_pool is None:
+                pool = Pool(minsize=0, creator=self.create_new_engine, dialect=self.__dialect)
+                object.__setattr__(self, '_Session__shared_pool', pool)
+        return self.__shared_pool
 
     @property
     def connection(self):
         connect = self.getitem('connect', None)
         if not connect:
-            connect = self.create_new_engine()
+            if self.__pool is not None:
+                connect = self.__pool.acquire_conn()
+            else:
+                connect = self.create_new_engine()
+            self.setitem('connect', connect)
+        return connect
+
+    @property
+    def replicas(self):
+        return self.__replicas
+
+    @property
+    def read_connection(self):
+        """
+        查询使用的连接：配置了只读副本时为当前上下文从副本借出的连接，
+        没有副本、副本全部不可用，或者当前上下文在`sticky_seconds`秒内提交过写操作时为主库的连接
+        """
+        if self.__replicas is None or self._sticky():
+            return self.connection
+        reader = self.getitem('reader', None)
+        if reader is None:
+            try:
+                reader = self.__replicas.acquire_conn()
+            except Exception:
+                logging.warning('no replica is available, reading from the primary')
+                return self.connection
+            self.setitem('reader', reader)
+        return reader[1]
+
+    @property
+    def shards(self):
+        return self.__shards
+
+    def shard_connection(self, shard: int):
+        """
+        :return: 当前上下文在`shard`号分片上的连接，第一次使用时从分片的连接池借出，`close()`时归还
+        """
+        connections = self.getitem('shards', None) or dict()
+        connect = connections.get(shard)
+        if connect is None:
+            connect = self._shard_pool(shard).acquire_conn()
+            self.setitem('shards', {**connections, shard: connect})
         return connect
 
+    def _shard_pool(self, shard: int):
+        if self.__shards is None:
+            raise RuntimeError('the session has no shards')
+        if not 0 <= shard < len(self.__shards):
+            raise RuntimeError(f'shard {shard} is not configured, the session has {len(self.__shards)} shards')
+        return self.__shards.pools[shard]
+
+    @contextmanager
+    def stream_connection(self, shard=None):
+        """
+        借出一个流式读取专用的连接，读取结束后归还。mysql的结果没有读完时，同一个连接上不能执行其他语句，
+        流式读取因此不使用当前上下文的连接，读取过程中仍可以用它加载关联和延迟加载的字段。
+        与查询一样选择主库、副本或`shard`号分片；读不到当前上下文的连接上未提交的修改
+        """
+        connect = self.getitem('stream', None)
+        if connect is not None and shard is None:
+            # lent by the caller (AsyncQuery), who also gives it back
+            yield connect
+            return
+        pool = None
+        if shard is not None:
+            pool = self._shard_pool(shard)
+        elif self.__replicas is not None and not self._sticky():
+            try:
+                pool, connect = self.__replicas.acquire_conn()
+            except Exception:
+                logging.warning('no replica is available, reading from the primary')
+        if connect is None:
+            pool = pool or self.shared_pool
+            connect = pool.acquire_conn()
+        try:
+            yield connect
+        finally:
+            pool.release_conn(connect)
+
+    def shard_of(self, record):
+        """
+        :return: 记录所在的分片序号，表单类没有分片或Session没有配置分片时为None
+        """
+        cls = record.__class__
+        if cls.__shard_map__ is None or self.__shards is None:
+            return None
+        value = record._row[cls.__kd_map__[cls.__shard_key__].position]
+        if value is NoneValue or value is None:
+            raise RuntimeError(f'{cls.__name__}.{cls.__shard_key__} is required to find the shard of {record}')
+        return cls.__shard_map__.shard_of(value)
+
+    @property
+    def identity_map(self) -> WeakValueDictionary:
+        """
+        当前上下文的identity map：(表单类, primary key的值) -> 实例。
+        只保存弱引用，实例不再被使用时自动移除，`close()`时清空
+        """
+        identity = self.getitem('identity', None)
+        if identity is None:
+            identity = WeakValueDictionary()
+            self.setitem('identity', identity)
+        return identity
+
     def get_current_session(self):
         return self.__local.get({})
 
     def setitem(self, key, value):
-        values = self.__local.get({})
+        # copy on write: a task or thread started with a copy of this context (asyncio tasks always are)
+        # shares the dict with its parent, writing into it would leak connections and queues between them
+        values = dict(self.__local.get({}))
         values[key] = value
         self.__local.set(values)
 
@@ -36,7 +224,6 @@ class Session:
         return values.get(item, default)
 
     def add(self, records):
-        queue = self.getitem('queue', [])
         if not isinstance(records, list):
             records = [records]
         if isinstance(records, list):
@@ -46,83 +233,351 @@ class Session:
                     operations.append(('update', record))
                 else:
                     operations.append(('insert', record))
-            queue.extend(operations)
-            self.setitem('queue', queue)
+            self._enqueue(operations)
+
+    def upsert(self, records):
+        """
+        插入记录，primary key（没有时为第一个unique字段）已经存在时更新其余已赋值的字段，
+        mysql为 ON DUPLICATE KEY UPDATE，sqlite为 ON CONFLICT ... DO UPDATE
+        """
+        if not isinstance(records, list):
+            records = [records]
+        self._enqueue([('upsert', record) for record in records])
 
     def remove(self, records):
-        queue = self.getitem('queue', [])
         if not isinstance(records, list):
             records = [records]
         if isinstance(records, list):
-            queue.extend([('delete', record) for record in records])
-            self.setitem('queue', queue)
+            self._enqueue([('delete', record) for record in records])
+
+    def _enqueue(self, operations: list):
+        queue = self.getitem('queue', None)
+        if queue is None:
+            # every context starts its own list, so an empty queue is never shared
+            # with the tasks or threads started from it
+            self.setitem('queue', operations)
+        else:
+            queue.extend(operations)
 
     def commit(self):
+        """
+        在同一个事务中按顺序执行队列中的全部操作，全部成功后只提交一次；
+        任意一条语句失败则整体回滚，队列保持不变
+        """
         queue = self.getitem('queue', [])
+        if not queue:
+            return
+        generated = list()      # (record, auto-increment primary key)
+        if self.__shards is None:
+            execute_statements(self.connection, self._flush_statements(queue, generated))
+        else:
+            execute_transactions([
+                (
+                    self.connection if shard is None else self.shard_connection(shard),
+                    self._flush_statements(operations, generated),
+                )
+                for shard, operations in self._route(queue).items()
+            ])
+        for record, value in generated:
+            record._row[record.__kd_map__[record.__primary_key__].position] = value
+        invalidate(*{record.table_name for _, record in queue})
+        identity = self.identity_map
         for operate, record in queue:
-            if operate == 'insert':
-                self._insert_one(record)
-            elif operate == 'update':
-                self._update_one(record)
-            elif operate == 'delete':
-                self._delete_one(record)
+            record._dirty = 0
+            primary_key = record.__primary_key__
+            if not primary_key:
+                continue
+            key = (record.__class__, getattr(record, primary_key))
+            if operate == 'delete':
+                identity.pop(key, None)
+                continue
+            if key[1] is NoneValue or key[1] is None:
+                # the generated key of a multi-row INSERT is unknown, adding the record again inserts it again
+                continue
+            if operate in ('insert', 'upsert'):
+                # the row exists now, adding the record again updates it
+                record.read_from_db = True
+            if operate == 'update' or self._complete(record):
+                identity[key] = record
             else:
-                raise RuntimeError('invalid operation')
-        self.setitem('queue', [])
+                # columns left to their database defaults are unknown, a query reads the whole row
+                identity.pop(key, None)
+        self.setitem('queue', None)
+        self._written()
 
-    def close(self):
-        self.getitem('connect').close()
-        self.__local.set({})
+    @staticmethod
+    def _complete(record) -> bool:
+        # every column a query reads by default is assigned
+        kd_map = record.__kd_map__
+        return all(record._row[kd_map[k].position] is not NoneValue for k in record.__default_columns__)
+
+    def insert_rows(self, cls, fields: tuple, rows) -> int:
+        """
+        立即在一个事务中批量插入已经验证过的行，不经过队列，也不创建表单类的实例
+        :param fields: 各列对应的字段名
+        :param rows: 与`fields`顺序一致的元组
+        :return: 插入的行数
+        """
+        count = 0
+
+        def statements(rows):
+            nonlocal count
+            for batch in self._batches(rows, len(fields)):
+                count += len(batch)
+                yield self._insert_statement(cls, fields, batch)
+
+        if cls.__shard_map__ is None or self.__shards is None:
+            execute_statements(self.connection, statements(rows))
+        else:
+            if cls.__shard_key__ not in fields:
+                raise RuntimeError(f'{cls.__name__}.{cls.__shard_key__} is required to find the shard of the rows')
+            position = fields.index(cls.__shard_key__)
+            routes = dict()
+            for row in rows:
+                if row[position] is None:
+                    raise RuntimeError(f'{cls.__name__}.{cls.__shard_key__} is required to find the shard of {row}')
+                routes.setdefault(cls.__shard_map__.shard_of(row[position]), []).append(row)
+            execute_transactions([(self.shard_connection(shard), statements(each)) for shard, each in routes.items()])
+        invalidate(cls.table_name)
+        self._written()
+        return count
 
-    def _execute(self, sql, values=None):
-        if self.connection is None:
-            raise RuntimeError('require db connection, got None')
+    def bulk_load(self, cls, records, chunk_bytes=16 * 1024 * 1024) -> BulkLoadResult:
+        """
+        立即用`LOAD DATA LOCAL INFILE`导入大量记录，不经过队列，比多行INSERT少了sql解析的开销。
+        记录按`encode_tsv()`写入临时文件，每写满约`chunk_bytes`字节导入一次，全部导入后提交一次。
+        mysql的连接参数需要`local_infile=True`，服务端需要开启`local_infile`
+        :param records: 表单类的实例，可以是生成器；导入的字段为第一条记录已赋值的字段，其余记录必须同样赋值
+        :return: BulkLoadResult(导入的行数, 警告数)，primary key重复等被跳过的行计入警告
+        """
+        if cls.__shard_map__ is not None and self.__shards is not None:
+            raise RuntimeError(f'bulk_load() does not route rows to shards, load each shard of {cls.__name__} separately')
+        records = iter(records)
+        first = next(records, None)
+        if first is None:
+            return BulkLoadResult(0, 0)
+        fields = tuple(k for k, v in zip(cls.__kd_map__, first._row) if v is not NoneValue)
+        positions = [cls.__kd_map__[k].position for k in fields]
 
-        logging.debug(f'\nexecute sql:\n{sql} \nwith values:{values}')
+        def rows():
+            for record in chain((first,), records):
+                row = [record._row[i] for i in positions]
+                if NoneValue in row:
+                    raise ValueError(f'every record of bulk_load() must assign the fields {fields}, got {record}')
+                yield row
 
+        connection = self.connection
+        loaded = warnings = 0
         try:
-            cursor = self.connection.cursor()
-            affected = cursor.execute(sql, values)
-            result = cursor.fetchall()
-            cursor.close()
-            self.connection.commit()
+            cursor = connection.cursor()
+            try:
+                for path in tsv_chunks(rows(), chunk_bytes):
+                    n, w = self.__dialect.load_file(cursor, cls.table_name, fields, path)
+                    loaded += n
+                    warnings += w
+            finally:
+                cursor.close()
+            connection.commit()
         except Exception as e:
-            self.connection.rollback()
+            connection.rollback()
             raise e
+        invalidate(cls.table_name)
+        self._written()
+        return BulkLoadResult(loaded, warnings)
 
-        logging.debug(f'affected: {affected}')
-        if affected == 0:
-            logging.debug('Attention! nothing happen after execute sql')
-        return result
+    def close(self):
+        """
+        关闭当前上下文的连接（使用连接池时归还给连接池），并清空当前上下文
+        """
+        connect = self.getitem('connect', None)
+        if connect is not None:
+            if self.__pool is not None:
+                self.__pool.release_conn(connect)
+            else:
+                connect.close()
+        reader = self.getitem('reader', None)
+        if reader is not None:
+            pool, connect = reader
+            pool.release_conn(connect)
+        for shard, connect in (self.getitem('shards', None) or dict()).items():
+            self.__shards.pools[shard].release_conn(connect)
+        self.__local.set({})
 
-    def _insert_one(self, record):
-        values = record.values()
-        placeholder = ["%s"] * len(values)
+    def dispose(self):
+        """
+        关闭当前上下文，以及Session自己创建的`shared_pool`和它的全部连接；之后需要时重新创建
+        """
+        self.close()
+        with self.__lock:
+            pool = self.__shared_pool
+            object.__setattr__(self, '_Session__shared_pool', None)
+        if pool is not None:
+            pool.close()
 
-        sql_template = sql_map['__insert__'].format(
-            table_name=record.table_name,
-            fields=','.join(record.kv_map.keys()),
-            values=','.join(placeholder)
-        )
-        self._execute(sql_template, values)
+    def _sticky(self) -> bool:
+        # reads go to the primary for `sticky_seconds` after this context wrote
+        written = self.getitem('written', None)
+        return written is not None and time.monotonic() - written < self.__sticky_seconds
 
-    def _insert_many(self, records: list):
-        assert len(records) > 0
-        cls = records[0].__class__
-        template = '(' + ','.join(["%s"] * len(cls.__kd_map__.keys())) + ')'
+    def _written(self):
+        # reads of this context go to the primary for `sticky_seconds` from now on
+        if self.__replicas is not None:
+            self.setitem('written', time.monotonic())
 
-        sql = sql_map['__insert_many__'].format(
-            table_name=cls.table_name,
-            fields=','.join(cls.__kd_map__.keys()),
-            values=',\n'.join([template] * len(records))
-        )
+    def _route(self, queue) -> dict:
+        """
+        按分片拆分队列，每个分片内保持提交时的顺序
+        :return: 分片序号（主库为None） -> 操作列表
+        """
+        routes = dict()
+        for operate, record in queue:
+            shard = self.shard_of(record)
+            if shard is not None and operate == 'update' and record._dirty & record.__kd_map__[record.__shard_key__].mask:
+                # the record would have to move to another shard
+                raise RuntimeError(f'the shard key of {record} can not be changed')
+            routes.setdefault(shard, []).append((operate, record))
+        return routes
+
+    def _flush_statements(self, queue, generated=None):
+        """
+        将队列转换为待执行的(sql, values, many)。
+        队列中相邻的、操作和(表单类, 字段)都相同的记录合并为一组批量执行，
+        各组之间保持提交时的顺序，不会把后面的记录提前到其他表单的操作之前
+        :param generated: 单独插入、primary key由auto_increment生成的记录，执行后把(记录, lastrowid)加入这个列表
+        """
+        current, records = None, list()
+        for op, record in queue:
+            cls = record.__class__
+            if op in ('insert', 'upsert'):
+                key = (op, cls, tuple(k for k, v in zip(cls.__kd_map__, record._row) if v is not NoneValue))
+            elif op == 'update':
+                # only the changed fields are sent, unchanged records are skipped
+                mask = record._dirty
+                if cls.__primary_key__:
+                    mask &= ~cls.__kd_map__[cls.__primary_key__].mask
+                if not mask:
+                    continue
+                key = (op, cls, mask)
+            elif op == 'delete':
+                key = (op, cls, None)
+            else:
+                raise RuntimeError('invalid operation')
+            if key != current:
+                yield from self._group_statements(current, records, generated)
+                current, records = key, list()
+            records.append(record)
+
+        yield from self._group_statements(current, records, generated)
+
+    def _group_statements(self, key, records: list, generated=None):
+        if not records:
+            return
+        operate, cls, fields = key
+        if operate == 'insert':
+            yield from self._insert_many(cls, fields, records, generated)
+        elif operate == 'upsert':
+            yield from self._upsert_many(cls, fields, records)
+        elif operate == 'update':
+            fields = tuple(k for k, v in cls.__kd_map__.items() if fields & v.mask)
+            yield from self._update_many(cls, fields, records)
+        elif operate == 'delete':
+            yield from self._delete_many(cls, records)
+
+    def _batches(self, rows, params_per_row=1):
+        """
+        按`max_batch_rows`和`max_batch_bytes`切分行，
+        避免单条语句超过mysql的`max_allowed_packet`，也不超过数据库单条语句的参数个数上限
+        :param params_per_row: 每行在语句中占用的参数个数
+        """
+        max_rows = self.__max_batch_rows
+        if self.__dialect.max_params:
+            max_rows = max(min(max_rows, self.__dialect.max_params // max(params_per_row, 1)), 1)
+        return batches(rows, max_rows, self.__max_batch_bytes)
+
+    def _insert_many(self, cls, fields: tuple, records: list, generated=None):
+        positions = [cls.__kd_map__[k].position for k in fields]
+        rows = (tuple([record._row[i] for i in positions]) for record in records)
+        if generated is not None and len(records) == 1 and self._generates_key(records[0]):
+            # cursor.lastrowid is the key of a single-row INSERT
+            record = records[0]
+            yield (*self._insert_statement(cls, fields, list(rows)),
+                   lambda cursor: generated.append((record, cursor.lastrowid)))
+            return
+        for batch in self._batches(rows, len(fields)):
+            yield self._insert_statement(cls, fields, batch)
 
+    @staticmethod
+    def _generates_key(record) -> bool:
+        primary_key = record.__primary_key__
+        if not primary_key:
+            return False
+        field = record.__kd_map__[primary_key]
+        value = record._row[field.position]
+        return getattr(field, 'auto_increment', False) and (value is None or value is NoneValue)
+
+    def _upsert_many(self, cls, fields: tuple, records: list):
+        positions = [cls.__kd_map__[k].position for k in fields]
+        rows = (tuple([record._row[i] for i in positions]) for record in records)
+        for batch in self._batches(rows, len(fields)):
+            args = list()
+            for row in batch:
+                args.extend(row)
+            yield cls.statement('upsert', fields, len(batch), self.__dialect), tuple(args), False
+
+    @staticmethod
+    def _insert_statement(cls, fields: tuple, rows: list):
+        args = list()
+        for row in rows:
+            args.extend(row)
+        return cls.statement('insert', fields, len(rows)), tuple(args), False
+
+    def _update_many(self, cls, fields: tuple, records: list):
+        """
+        有primary key时批量更新相同字段集合的记录：
+        - `update_strategy='case'`: 每批生成一条 UPDATE ... SET col = CASE pk WHEN ... END WHERE pk IN (...)
+        - `update_strategy='executemany'`: 同一条语句交给`cursor.executemany`
+        没有primary key时逐条更新
+        """
+        primary_key = cls.__primary_key__
+        if not primary_key:
+            for record in records:
+                yield self._update_one(record)
+            return
+        if not fields:
+            return
+
+        # the primary key goes last, matching `WHERE pk=%s`
+        positions = [cls.__kd_map__[k].position for k in fields]
+        positions.append(cls.__kd_map__[primary_key].position)
+        rows, seen = list(), set()
+        for record in records:
+            if id(record) in seen:    # the same record was added more than once
+                continue
+            seen.add(id(record))
+            row = tuple([record._row[i] for i in positions])
+            if row[-1] is NoneValue or row[-1] is None:
+                raise RuntimeError("missing primary key's value")
+            rows.append(row)
+
+        sql = cls.statement('update', fields)
+        if len(rows) == 1:
+            yield sql, rows[0], False
+        elif self.__update_strategy == 'executemany':
+            yield sql, rows, True
+        else:
+            # CASE pk WHEN %s THEN %s per field, plus the pk in `IN (...)`
+            for batch in self._batches(rows, 2 * len(fields) + 1):
+                yield self._update_case_statement(cls, fields, batch)
+
+    @staticmethod
+    def _update_case_statement(cls, fields: tuple, rows: list):
         args = list()
-        for each in records:
-            if type(each) != cls:
-                raise ValueError(f'insert_many() required the same Model, got {type(each)}')
-            args.extend(each.values())
-        self._execute(sql, tuple(args))
+        for i in range(len(fields)):
+            for row in rows:
+                args.append(row[-1])
+                args.append(row[i])
+        args.extend(row[-1] for row in rows)
+        return cls.statement('update_case', fields, len(rows)), tuple(args), False
 
     def _update_one(self, record, **kwargs):
         primary_key_value = record.kv_map.get(record.__primary_key__)
@@ -133,7 +588,8 @@ class Session:
             set_kv = kwargs
             for unchanged_field in unchanged_fields:
                 where_kv[unchanged_field] = record.kv_map.get(unchanged_field)
-            record.kv_map.update(kwargs)
+            for k, v in kwargs.items():
+                setattr(record, k, v)
         elif record.__primary_key__:
             if primary_key_value is not NoneValue:
                 where_kv[record.__primary_key__] = primary_key_value
@@ -157,15 +613,45 @@ class Session:
         values = list()
         values.extend(set_kv.values())
         values.extend(where_kv.values())
-        self._execute(sql_template, values)
+        return sql_template, values, False
+
+    def _delete_many(self, cls, records: list):
+        """
+        有primary key时按primary key批量删除：DELETE FROM ... WHERE pk IN (...)，
+        否则逐条删除
+        """
+        primary_key = cls.__primary_key__
+        if not primary_key:
+            for record in records:
+                yield self._delete_one(record)
+            return
+
+        position = cls.__kd_map__[primary_key].position
+        keys = list()
+        for record in records:
+            primary_key_value = record._row[position]
+            if primary_key_value is NoneValue or primary_key_value is None:
+                raise RuntimeError("missing primary key's value")
+            keys.append((primary_key_value,))
+
+        for batch in self._batches(dict.fromkeys(keys)):
+            yield cls.statement('delete', size=len(batch)), tuple(key for key, in batch), False
 
     def _delete_one(self, record):
-        clause = ' AND '.join(f'{k}={"%s"}' for k, v in record.kv_map.items())
+        """
+        没有primary key时用已赋值的全部字段作为条件，值为None的字段使用`IS NULL`
+        """
+        conditions, values = list(), list()
+        for k, v in record.kv_map.items():
+            if v is NoneValue:
+                continue
+            if v is None:
+                conditions.append(f'{k} IS NULL')
+            else:
+                conditions.append(f'{k}={"%s"}')
+                values.append(v)
         sql_template = sql_map['__delete__'].format(
             table_name=record.table_name,
-            clause=clause
+            clause=' AND '.join(conditions)
         )
-        self._execute(sql_template, tuple(record.kv_map.values()))
-
-
-
+        return sql_template, tuple(values), False
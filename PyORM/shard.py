@@ -0,0 +1,78 @@
+import zlib
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ShardMap:
+    """
+    分片键的值 -> 分片序号（0到size-1），在表单类上声明：
+        class Event(db.Model, shard_key='user_id', shard_map=HashShardMap(4)):
+            ...
+    """
+    size = 0
+
+    def shard_of(self, value) -> int:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.size})'
+
+
+class HashShardMap(ShardMap):
+    """
+    按哈希值取模：整数直接取模，其余值取字符串的crc32，在不同进程之间保持一致
+    """
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError(f'require at least one shard, got {size}')
+        self.size = size
+
+    def shard_of(self, value) -> int:
+        if not isinstance(value, int):
+            value = zlib.crc32(str(value).encode())
+        return value % self.size
+
+
+class RangeShardMap(ShardMap):
+    """
+    按范围分片，`bounds`为各分片的上界（不包含）：
+        RangeShardMap([1000, 2000])   # <1000为0号分片，[1000, 2000)为1号，>=2000为2号
+    """
+    def __init__(self, bounds):
+        bounds = list(bounds)
+        if not bounds or bounds != sorted(bounds):
+            raise ValueError(f'bounds must be sorted and not empty, got {bounds}')
+        self.bounds = bounds
+        self.size = len(bounds) + 1
+
+    def shard_of(self, value) -> int:
+        return bisect.bisect_right(self.bounds, value)
+
+
+class ShardSet:
+    """
+    分片数据库，每个分片一个连接池，序号与ShardMap的分片序号对应；
+    跨分片的查询在有`len(pools)`个线程的线程池中并行执行
+    """
+    def __init__(self, pools):
+        if not pools:
+            raise ValueError('require at least one shard')
+        self.pools = list(pools)
+        self.executor = ThreadPoolExecutor(max_workers=len(self.pools), thread_name_prefix='PyORM-shard')
+
+    def __len__(self):
+        return len(self.pools)
+
+    def map(self, func, items) -> list:
+        """
+        并行执行`func(item)`，返回与`items`顺序一致的结果，任意一个失败时抛出它的异常
+        """
+        items = list(items)
+        if len(items) == 1:
+            return [func(items[0])]
+        return list(self.executor.map(func, items))
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
+        self.executor.shutdown(wait=False)
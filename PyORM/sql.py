@@ -11,3 +11,70 @@ sql_map.update({
     '__select_all__':   'SELECT * FROM {table_name};',
 })
 
+
+def compile_statement(table_name, primary_key, operation, fields=(), size=1) -> str:
+    """
+    生成参数化的sql语句
+    :param operation: insert, update, update_case, delete
+    :param fields: 语句涉及的字段
+    :param size: 批量语句包含的行数
+    """
+    if operation == 'insert':
+        template = '(' + ','.join(['%s'] * len(fields)) + ')'
+        return sql_map['__insert_many__'].format(
+            table_name=table_name,
+            fields=','.join(fields),
+            values=',\n'.join([template] * size)
+        )
+    if operation == 'update':
+        return sql_map['__update__'].format(
+            table_name=table_name,
+            fields=','.join([f'{k}=%s' for k in fields]),
+            clause=f'{primary_key}=%s'
+        )
+    if operation == 'update_case':
+        when = ' '.join(['WHEN %s THEN %s'] * size)
+        return sql_map['__update__'].format(
+            table_name=table_name,
+            fields=','.join([f'{k}=CASE {primary_key} {when} END' for k in fields]),
+            clause=f'{primary_key} IN ({",".join(["%s"] * size)})'
+        )
+    if operation == 'delete':
+        return sql_map['__delete__'].format(
+            table_name=table_name,
+            clause=f'{primary_key} IN ({",".join(["%s"] * size)})'
+        )
+    raise ValueError(f'unknown operation: {operation}')
+
+
+def compile_select(
+        table_name,
+        columns,
+        where=None,
+        order_by=(),
+        limit=False,
+        offset=False,
+        unlimited='18446744073709551615',
+) -> str:
+    """
+    生成参数化的SELECT语句
+    :param columns: 查询的列
+    :param where: WHERE子句（已经参数化）
+    :param order_by: ORDER BY的各项
+    :param limit: 是否有LIMIT参数
+    :param offset: 是否有OFFSET参数
+    :param unlimited: 只有OFFSET时LIMIT的值，默认为mysql的写法
+    """
+    sql = f'SELECT {",".join(columns)} FROM {table_name}'
+    if where:
+        sql += f' WHERE {where}'
+    if order_by:
+        sql += f' ORDER BY {",".join(order_by)}'
+    if limit:
+        sql += ' LIMIT %s'
+    elif offset:
+        # OFFSET without LIMIT is not supported by mysql and sqlite
+        sql += f' LIMIT {unlimited}'
+    if offset:
+        sql += ' OFFSET %s'
+    return sql + ';'
@@ -1,41 +1,224 @@
-import pymysql
+import os
+import time
 import logging
-from PyORM.sql import sql_map
+import tempfile
+from PyORM import events
+from PyORM.dialect import mysql, dialect_of, encode_tsv
+
+# ids of the connections `stream_sql()` is reading an unfinished, unbuffered result from
+_streaming = set()
 
 
 def create_engine(user='', password='', host='localhost', port=3306, **kwargs):
-    return pymysql.connect(
-        user=user,
-        password=password,
-        host=host,
-        port=port,
-        **kwargs
-    )
+    return mysql.connect(user=user, password=password, host=host, port=port, **kwargs)
 
 
 def create_db(user: str, password: str, host: str, port: int, db: str):
     conn = create_engine(user, password, host, port)
-    sql = sql_map['__create_db__'].format(db_name=db)
+    sql = mysql.create_database(db)
     execute_sql(conn, sql)
 
 
-def execute_sql(connection: pymysql.Connection, sql, values=None):
+def _check_idle(connection):
+    """
+    mysql的无缓冲结果没有读完时，在同一个连接上执行其他语句会丢弃未读取的行，流式读取因此被静默截断
+    """
+    if id(connection) in _streaming:
+        raise RuntimeError(
+            'the connection is streaming a query result, a statement on it would cut the stream short: '
+            'bind the query to a Session (streams then use a connection of their own), '
+            'or run the statement after the iteration'
+        )
+
+
+def estimate_size(values) -> int:
+    """
+    粗略估算一行参数转义后在sql语句中占用的字节数，用于切分多行INSERT
+    """
+    size = 0
+    for value in values:
+        if isinstance(value, str):
+            # non-ascii characters take up to 4 bytes in utf8mb4
+            size += len(value) + 3 if value.isascii() else len(value) * 4 + 3
+        else:
+            size += len(str(value)) + 3
+    return size
+
+
+def batches(rows, max_rows, max_bytes):
+    """
+    按行数和估算的参数字节数切分行，避免单条语句超过mysql的`max_allowed_packet`
+    """
+    batch, size = list(), 0
+    for row in rows:
+        row_size = estimate_size(row)
+        if batch and (len(batch) >= max_rows or size + row_size > max_bytes):
+            yield batch
+            batch, size = list(), 0
+        batch.append(row)
+        size += row_size
+    if batch:
+        yield batch
+
+
+def tsv_chunks(rows, max_bytes):
+    """
+    将行按`encode_tsv()`的格式依次写入临时文件，每个文件约`max_bytes`字节（按字符数估算）。
+    调用方处理完一个文件、继续迭代时文件即被删除，磁盘占用不超过一个文件
+    :return: 生成器，产生临时文件的路径
+    """
+    f, size = None, 0
+    try:
+        for row in rows:
+            if f is None:
+                f = tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', suffix='.tsv', delete=False)
+                size = 0
+            line = encode_tsv(row)
+            f.write(line)
+            size += len(line)
+            if size >= max_bytes:
+                f.close()
+                yield f.name
+                os.remove(f.name)
+                f = None
+        if f is not None:
+            f.close()
+            yield f.name
+    finally:
+        if f is not None:
+            f.close()
+            if os.path.exists(f.name):
+                os.remove(f.name)
+
+
+def execute_statements(connection, statements) -> int:
+    """
+    在同一个事务中依次执行(sql, values, many)，全部成功后只提交一次；任意一条失败则回滚
+    :return: 受影响的总行数
+    """
+    return execute_transactions([(connection, statements)])
+
+
+def execute_transactions(work) -> int:
+    """
+    在多个连接上依次执行各自的(sql, values, many)，全部执行成功后才逐个提交，提交之前任意一条失败则全部回滚。
+    多个连接的提交不是原子的：某个连接提交失败时，已经提交的连接不会回滚
+    :param work: [(连接, 语句)]，语句可以带第四项：执行后以游标为参数调用的函数，例如读取`lastrowid`
+    :return: 受影响的总行数
+    """
+    total = 0
+    for connection, _ in work:
+        _check_idle(connection)
+    try:
+        for connection, statements in work:
+            cursor = connection.cursor()
+            try:
+                for sql, values, many, *callback in statements:
+                    total += _execute(cursor, sql, values, many) or 0
+                    if callback:
+                        callback[0](cursor)
+            finally:
+                cursor.close()
+        for connection, _ in work:
+            connection.commit()
+    except Exception as e:
+        for connection, _ in work:
+            try:
+                connection.rollback()
+            except Exception:
+                logging.exception('rollback failed')
+        raise e
+    return total
+
+
+def _execute(cursor, sql, values=None, many=False):
+    logging.debug('\nexecute sql:\n%s \nwith values:%s', sql, values)
+    instrumented = bool(events.listeners['statement'])
+    start = time.perf_counter() if instrumented else 0
+    if many:
+        affected = cursor.executemany(sql, values)
+    else:
+        affected = cursor.execute(sql, values)
+    if instrumented:
+        events.emit('statement', events.StatementEvent(
+            sql, events.count_params(values, many), time.perf_counter() - start, affected=affected, many=many,
+        ))
+    logging.debug('affected: %s', affected)
+    if affected == 0:
+        logging.debug('Attention! nothing happen after execute sql')
+    return affected
+
+
+def execute_sql(connection, sql, values=None):
     if connection is None:
         raise RuntimeError('require db connection, got None')
-    logging.debug(f'\nexecute sql:\n{sql} \nwith values:{values}')
+    _check_idle(connection)
+    logging.debug('\nexecute sql:\n%s \nwith values:%s', sql, values)
 
+    instrumented = bool(events.listeners['statement'])
     try:
+        start = time.perf_counter() if instrumented else 0
         cursor = connection.cursor()
         affected = cursor.execute(sql, values)
         result = cursor.fetchall()
         cursor.close()
+        if instrumented:
+            duration = time.perf_counter() - start
         connection.commit()
     except Exception as e:
         connection.rollback()
         raise e
 
-    msg = f'affected: {affected}\n'
+    logging.debug('affected: %s', affected)
     if affected == 0:
-        msg = msg + 'Attention! nothing happen after execute sql\n'
-    logging.debug(msg)
+        logging.debug('Attention! nothing happen after execute sql')
+    if instrumented:
+        events.emit('statement', events.StatementEvent(
+            sql, events.count_params(values), duration, rows=len(result), affected=affected,
+        ))
     return result
+
+
+def stream_sql(connection, sql, values=None, size=1000):
+    """
+    使用无缓冲的游标（mysql为`SSCursor`）执行查询，每次只从服务端读取`size`行，
+    客户端内存占用与结果集大小无关
+    :return: 生成器，每次产生不超过`size`行的元组
+    """
+    if connection is None:
+        raise RuntimeError('require db connection, got None')
+    _check_idle(connection)
+    logging.debug('\nstream sql:\n%s \nwith values:%s', sql, values)
+
+    # the duration covers the time spent in the database driver only,
+    # not the time the consumer spends between two chunks
+    instrumented = bool(events.listeners['statement'])
+    duration, count = 0.0, 0
+    dialect = dialect_of(connection)
+    cursor = dialect.stream_cursor(connection)
+    if not dialect.buffered_stream:
+        _streaming.add(id(connection))
+    try:
+        start = time.perf_counter() if instrumented else 0
+        cursor.execute(sql, values)
+        while True:
+            rows = cursor.fetchmany(size)
+            if instrumented:
+                duration += time.perf_counter() - start
+                count += len(rows)
+            if not rows:
+                break
+            yield rows
+            start = time.perf_counter() if instrumented else 0
+    except Exception as e:
+        connection.rollback()
+        raise e
+    finally:
+        # also runs when the consumer stops early (GeneratorExit),
+        # SSCursor.close() drains the unread rows so that the connection stays usable
+        _streaming.discard(id(connection))
+        cursor.close()
+        if instrumented:
+            events.emit('statement', events.StatementEvent(sql, events.count_params(values), duration, rows=count))
+    connection.commit()
+
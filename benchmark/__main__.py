@@ -0,0 +1,117 @@
+"""
+运行全部基准测试，结果以JSON输出，便于在版本之间比较：
+
+python -m benchmark                                    # FakeConnection，不需要数据库
+python -m benchmark --backend sqlite -n 5000 --output result.json
+python -m benchmark --compare result.json              # 与之前的结果比较
+python -m benchmark --case flush_update --latency 0.0002
+"""
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+from benchmark.suite import cases, FakeBackend, SQLiteBackend
+
+
+def measure(case, backend, n, repeat) -> dict:
+    timings, statements = list(), None
+    for i in range(repeat):
+        run, connection = case(backend, n)
+        before = connection.statements if connection is not None else 0
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+        if connection is not None:
+            statements = connection.statements - before
+    best = min(timings)
+    return dict(
+        n=n,
+        repeat=repeat,
+        best=best,
+        mean=statistics.mean(timings),
+        stdev=statistics.stdev(timings) if repeat > 1 else 0.0,
+        per_op_us=best / n * 1e6,
+        statements=statements,
+    )
+
+
+def revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(report, baseline, threshold):
+    """
+    :return: 比之前慢超过`threshold`倍的用例
+    """
+    slower = list()
+    if baseline.get('meta', {}).get('backend') != report['meta']['backend']:
+        print('warning: the baseline was measured with another backend', file=sys.stderr)
+    print(f'{"case":<24}{"before(us/op)":>16}{"now(us/op)":>14}{"ratio":>8}', file=sys.stderr)
+    for name, result in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        ratio = result['per_op_us'] / before['per_op_us'] if before['per_op_us'] else float('inf')
+        mark = ' !' if ratio > threshold else ''
+        print(f'{name:<24}{before["per_op_us"]:>16.3f}{result["per_op_us"]:>14.3f}{ratio:>8.2f}{mark}', file=sys.stderr)
+        if ratio > threshold:
+            slower.append(name)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description='PyORM overhead benchmarks')
+    parser.add_argument('--backend', choices=('fake', 'sqlite'), default='fake')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per round trip of the fake backend')
+    parser.add_argument('-n', type=int, default=1000, help='records / operations per case')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--case', action='append', choices=sorted(cases), help='run only these cases')
+    parser.add_argument('--output', help='write the json result to this file instead of stdout')
+    parser.add_argument('--compare', help='a previous json result to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2, help='ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    backend = SQLiteBackend() if args.backend == 'sqlite' else FakeBackend(args.latency)
+    results = dict()
+    for name in args.case or cases:
+        results[name] = measure(cases[name], backend, args.n, args.repeat)
+
+    report = dict(
+        meta=dict(
+            backend=args.backend,
+            latency=args.latency if args.backend == 'fake' else None,
+            python=platform.python_version(),
+            implementation=platform.python_implementation(),
+            platform=platform.platform(),
+            revision=revision(),
+            created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        ),
+        results=results,
+    )
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data + '\n')
+    else:
+        print(data)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
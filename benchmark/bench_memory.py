@@ -0,0 +1,77 @@
+"""
+比较不同实例布局每条记录占用的内存：
+- dict: 原来的布局，实例`__dict__`中保存`kv_map`字典和`read_from_db`
+- list: 字段值保存在列表`_row`中，实例仍然有`__dict__`
+- compact: `compact=True`，实例只有`__slots__`，没有`__dict__`
+
+python -m benchmark.bench_memory
+"""
+import gc
+import tracemalloc
+from PyORM.orm import Model
+from PyORM.fields import Integer, Double, String, Boolean, Date, DateTime, NoneValue
+
+FIELDS = ('uid', 'age', 'height', 'username', 'sex', 'birthday', 'last_seen')
+VALUES = (1, 24, 1.75, 'lrh', True, '1999-09-19', '2020-01-01 00:00:00')
+
+
+class DictStudent:
+    # the instance layout before `_row` was introduced
+    def __init__(self, **kwargs):
+        self.read_from_db = True
+        self.kv_map = dict.fromkeys(FIELDS, NoneValue)
+        self.kv_map.update(kwargs)
+
+
+def init(self, **kwargs):
+    Model.__init__(self)
+    for k, v in kwargs.items():
+        setattr(self, k, v)
+
+
+class Student(Model):
+    table_name = 'students'
+    uid = Integer(primary_key=True, auto_increment=True)
+    age = Integer()
+    height = Double(m=5, d=3)
+    username = String(max_length=128)
+    sex = Boolean(default=False)
+    birthday = Date()
+    last_seen = DateTime()
+    __init__ = init
+
+
+class CompactStudent(Model, compact=True):
+    table_name = 'students'
+    uid = Integer(primary_key=True, auto_increment=True)
+    age = Integer()
+    height = Double(m=5, d=3)
+    username = String(max_length=128)
+    sex = Boolean(default=False)
+    birthday = Date()
+    last_seen = DateTime()
+    __init__ = init
+
+
+def bytes_per_instance(factory, n):
+    kwargs = dict(zip(FIELDS, VALUES))
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = [factory(**kwargs) for _ in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the list holding the instances is not part of the instance
+    return (after - before) / n - 8, len(instances)
+
+
+def main(n=100000):
+    print(f'instances={n}, field values are shared between instances')
+    print(f'{"layout":<10}{"bytes/instance":>16}')
+    for name, factory in (('dict', DictStudent), ('list', Student), ('compact', CompactStudent)):
+        size, _ = bytes_per_instance(factory, n)
+        print(f'{name:<10}{size:>16.1f}')
+
+
+if __name__ == '__main__':
+    main()
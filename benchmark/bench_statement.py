@@ -0,0 +1,75 @@
+"""
+对比开启/关闭表单类的sql语句缓存时，语句构造在写入和查询中的开销
+
+python -m benchmark.bench_statement
+"""
+import time
+import cProfile
+import pstats
+from PyORM.orm import Model
+from PyORM.fields import Integer, String, Double
+from PyORM.sql import compile_statement, compile_select
+from benchmark.fake import fake_session, FakeConnection
+
+
+class Item(Model):
+    table_name = 'items'
+    uid = Integer(primary_key=True)
+    name = String(max_length=64)
+    price = Double()
+
+    def __init__(self, uid, name, price):
+        super().__init__()
+        self.uid = uid
+        self.name = name
+        self.price = price
+
+
+def flush(n, batch_rows):
+    session = fake_session(max_batch_rows=batch_rows)
+    session.add([Item(uid=i, name=f'item-{i}', price=i * 0.5) for i in range(n)])
+    session.commit()
+
+
+def filter_by(n):
+    query = Item.query(FakeConnection(rows=[(1, 'item-1', 0.5)]))
+    for i in range(n):
+        query.filter_by(name='item-1')
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def compile_calls(func, *args):
+    """
+    :return: 构造sql语句的次数：写入由`compile_statement`构造，查询由`compile_select`构造
+    """
+    profile = cProfile.Profile()
+    profile.runcall(func, *args)
+    stats = pstats.Stats(profile)
+    names = (compile_statement.__name__, compile_select.__name__)
+    return sum(calls for (_, _, name), (_, calls, *_) in stats.stats.items() if name in names)
+
+
+def main(n=10000):
+    cases = [
+        (f'flush {n} inserts, 1 row per statement', flush, n, 1),
+        (f'flush {n} inserts, 100 rows per statement', flush, n, 100),
+        (f'filter_by x {n}', filter_by, n),
+    ]
+    print(f'{"case":<45}{"cache":>7}{"compiles":>10}{"elapsed(ms)":>14}')
+    for name, func, *args in cases:
+        for maxsize in (0, 256):
+            Item.__sql_cache__.maxsize = maxsize
+            Item.__sql_cache__.clear()
+            calls = compile_calls(func, *args)
+            elapsed = measure(func, *args)
+            state = 'on' if maxsize else 'off'
+            print(f'{name:<45}{state:>7}{calls:>10}{elapsed * 1000:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
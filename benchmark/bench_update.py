@@ -0,0 +1,84 @@
+"""
+对比批量update/delete的几种方式：
+- row: 每条记录一条语句（原来的实现）
+- executemany: 同一条语句交给`cursor.executemany`，pymysql对UPDATE仍然逐行往返
+- case: 每批一条 UPDATE ... SET col = CASE pk ... END / DELETE ... WHERE pk IN (...)
+
+python -m benchmark.bench_update
+"""
+import time
+from PyORM.orm import Model
+from PyORM.fields import Integer, String, Double
+from benchmark.fake import fake_session
+
+
+class Item(Model):
+    table_name = 'items'
+    uid = Integer(primary_key=True)
+    name = String(max_length=64)
+    price = Double()
+
+    def __init__(self, uid, name, price):
+        super().__init__()
+        self.uid = uid
+        self.name = name
+        self.price = price
+
+
+def make_records(n):
+    records = list()
+    for i in range(n):
+        record = Item(uid=i + 1, name=f'item-{i}', price=i * 0.5)
+        record.read_from_db = True
+        records.append(record)
+    return records
+
+
+def run(session, operate, records):
+    if operate == 'update':
+        session.add(records)
+    else:
+        session.remove(records)
+    connection = session.connection
+    before = connection.round_trips
+    start = time.perf_counter()
+    session.commit()
+    elapsed = time.perf_counter() - start
+    return elapsed, connection.round_trips - before
+
+
+def run_per_row(session, operate, records):
+    # the behaviour before batching: one statement per record
+    connection = session.connection
+    before = connection.round_trips
+    start = time.perf_counter()
+    cursor = connection.cursor()
+    for record in records:
+        if operate == 'update':
+            sql, values, _ = session._update_one(record)
+        else:
+            sql, values, _ = session._delete_one(record)
+        cursor.execute(sql, values)
+    connection.commit()
+    elapsed = time.perf_counter() - start
+    return elapsed, connection.round_trips - before
+
+
+def main(n=1000, latency=0.0002):
+    print(f'records={n} latency={latency * 1000:.2f}ms per round trip')
+    print(f'{"operation":<10}{"strategy":<14}{"round trips":>12}{"elapsed(ms)":>14}')
+    for operate in ('update', 'delete'):
+        session = fake_session(latency=latency)
+        elapsed, trips = run_per_row(session, operate, make_records(n))
+        print(f'{operate:<10}{"row":<14}{trips:>12}{elapsed * 1000:>14.2f}')
+        for strategy in ('executemany', 'case'):
+            if operate == 'delete' and strategy == 'executemany':
+                continue
+            session = fake_session(latency=latency, update_strategy=strategy)
+            elapsed, trips = run(session, operate, make_records(n))
+            name = strategy if operate == 'update' else 'in'
+            print(f'{operate:<10}{name:<14}{trips:>12}{elapsed * 1000:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import time
+from PyORM.session import Session
+
+
+class FakeCursor:
+    """
+    模拟pymysql的cursor，每次execute视为一次网络往返
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = ()
+        self.position = 0
+
+    def execute(self, sql, args=None):
+        self.connection.round_trip(sql, args)
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.rows = self.connection.rows
+        else:
+            self.rows = ()
+        self.position = 0
+        return len(self.rows)
+
+    def executemany(self, sql, args):
+        # pymysql only rewrites `INSERT ... VALUES` into one multi-row statement,
+        # any other statement is executed once per row
+        affected = 0
+        for each in args:
+            affected += self.execute(sql, each)
+        return affected
+
+    def fetchall(self):
+        rows = self.rows[self.position:]
+        self.position = len(self.rows)
+        return rows
+
+    def fetchmany(self, size=1):
+        rows = self.rows[self.position:self.position + size]
+        self.position += len(rows)
+        return rows
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def close(self):
+        self.rows = ()
+
+
+class FakeConnection:
+    """
+    不依赖mysql服务的连接，用固定的延迟模拟每次网络往返
+    :param latency: 每次往返的延迟（秒）
+    :param rows: SELECT语句返回的行
+    """
+    def __init__(self, latency=0.0, rows=()):
+        self.latency = latency
+        self.rows = tuple(rows)
+        self.round_trips = 0
+        self.statements = 0
+
+    def round_trip(self, sql, args, statement=True):
+        self.round_trips += 1
+        if statement:
+            self.statements += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.round_trip('COMMIT', None, statement=False)
+
+    def rollback(self):
+        self.round_trip('ROLLBACK', None, statement=False)
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+def fake_session(latency=0.0, rows=(), **kwargs):
+    """
+    :return: 使用FakeConnection作为连接的Session
+    """
+    class FakeSession(Session):
+        __slots__ = ()
+
+        def create_new_engine(self):
+            return FakeConnection(latency=latency, rows=rows)
+
+    return FakeSession(config={}, **kwargs)
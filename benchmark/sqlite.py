@@ -0,0 +1,38 @@
+from PyORM.session import Session
+from PyORM.dialect import SQLiteDialect, SQLiteConnection, SQLiteCursor
+
+
+class CountingCursor(SQLiteCursor):
+    def execute(self, sql, args=None):
+        self.connection.statements += 1
+        return super().execute(sql, args)
+
+    def executemany(self, sql, args):
+        self.connection.statements += 1
+        return super().executemany(sql, args)
+
+
+class CountingConnection(SQLiteConnection):
+    """
+    统计执行语句数的sqlite连接，数据保存在内存中，每个连接是一个独立的数据库
+    """
+    def __init__(self):
+        dialect = SQLiteDialect()
+        super().__init__(dialect.connect().raw, dialect)
+        self.statements = 0
+
+    def cursor(self, cursor_class=None):
+        return CountingCursor(self)
+
+
+def sqlite_session(connection: CountingConnection, **kwargs):
+    """
+    :return: 使用`connection`作为连接的Session
+    """
+    class SQLiteSession(Session):
+        __slots__ = ()
+
+        def create_new_engine(self):
+            return connection
+
+    return SQLiteSession(config={}, dialect=connection.dialect, **kwargs)
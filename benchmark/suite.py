@@ -0,0 +1,182 @@
+"""
+ORM自身开销的基准测试用例，每个用例接收(backend, n)，完成准备工作后返回(待计时的函数, 连接)，
+连接用于统计执行的语句数，不涉及数据库的用例返回None
+"""
+from PyORM.orm import Model
+from PyORM.fields import Integer, String, Double, Boolean, Date
+from PyORM.sql import compile_statement
+from benchmark.fake import FakeConnection, fake_session
+from benchmark.sqlite import CountingConnection, sqlite_session
+
+
+class Item(Model):
+    table_name = 'items'
+    uid = Integer(primary_key=True)
+    name = String(max_length=64)
+    price = Double()
+    on_sale = Boolean()
+    created = Date()
+
+    def __init__(self, uid, name, price, on_sale=False, created='2020-01-01'):
+        super().__init__()
+        self.uid = uid
+        self.name = name
+        self.price = price
+        self.on_sale = on_sale
+        self.created = created
+
+
+def rows(n) -> list:
+    return [(i + 1, f'item-{i}', i * 0.5, i % 2 == 0, '2020-01-01') for i in range(n)]
+
+
+def loaded(n) -> list:
+    """
+    :return: 模拟从数据库读取的n条记录
+    """
+    return list(map(Item.hydrator(), rows(n)))
+
+
+class FakeBackend:
+    """
+    FakeConnection：每次往返固定延迟，SELECT返回预先提供的行
+    """
+    name = 'fake'
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def connection(self, n=0):
+        return FakeConnection(latency=self.latency, rows=rows(n))
+
+    def session(self, n=0, **kwargs):
+        return fake_session(latency=self.latency, rows=rows(n), **kwargs)
+
+
+class SQLiteBackend:
+    """
+    内存中的sqlite数据库，每次准备时重新建表并写入n行
+    """
+    name = 'sqlite'
+
+    def connection(self, n=0):
+        connection = CountingConnection()
+        cursor = connection.cursor()
+        for sql in Item.ddl_statements(connection.dialect):
+            cursor.execute(sql)
+        if n:
+            cursor.executemany(Item.statement('insert', tuple(Item.__kd_map__)), rows(n))
+        connection.commit()
+        connection.statements = 0
+        return connection
+
+    def session(self, n=0, **kwargs):
+        return sqlite_session(self.connection(n), **kwargs)
+
+
+def bench_construct(backend, n):
+    # __init__ with field validation and formatting
+    def run():
+        for i in range(n):
+            Item(uid=i, name='item', price=1.5, on_sale=True, created='2020-01-01')
+    return run, None
+
+
+def bench_hydrate(backend, n):
+    connection = backend.connection(n)
+    return Item.query(connection).all, connection
+
+
+def bench_hydrate_tuples(backend, n):
+    connection = backend.connection(n)
+    return Item.query(connection).as_tuples().all, connection
+
+
+def bench_hydrate_dicts(backend, n):
+    connection = backend.connection(n)
+    return Item.query(connection).as_dicts().all, connection
+
+
+def bench_flush_insert(backend, n):
+    session = backend.session()
+    session.add([Item(uid=i + 1, name=f'item-{i}', price=i * 0.5) for i in range(n)])
+    return session.commit, session.connection
+
+
+def bench_bulk_create(backend, n):
+    # column-oriented insert, no model instances
+    session = backend.session()
+    columns = dict(
+        uid=list(range(1, n + 1)),
+        name=[f'item-{i}' for i in range(n)],
+        price=[i * 0.5 for i in range(n)],
+        on_sale=[i % 2 == 0 for i in range(n)],
+        created=['2020-01-01'] * n,
+    )
+    return lambda: Item.bulk_create(session, columns), session.connection
+
+
+def bench_bulk_load(backend, n):
+    # LOAD DATA LOCAL INFILE through a temporary tsv file
+    session = backend.session()
+    records = [Item(uid=i + 1, name=f'item-{i}', price=i * 0.5) for i in range(n)]
+    return lambda: session.bulk_load(Item, records), session.connection
+
+
+def bench_flush_update(backend, n):
+    session = backend.session(n)
+    records = loaded(n)
+    for record in records:
+        record.price = record.price + 1
+    session.add(records)
+    return session.commit, session.connection
+
+
+def bench_flush_delete(backend, n):
+    session = backend.session(n)
+    session.remove(loaded(n))
+    return session.commit, session.connection
+
+
+def bench_ddl(backend, n):
+    def run():
+        for i in range(n):
+            Item.ddl()
+    return run, None
+
+
+def bench_statement(backend, n):
+    # cached statements, as used by Session flushes
+    fields = tuple(Item.__kd_map__)
+
+    def run():
+        for i in range(n):
+            Item.statement('insert', fields, 100)
+            Item.statement('update', fields[1:])
+    return run, None
+
+
+def bench_statement_uncached(backend, n):
+    fields = tuple(Item.__kd_map__)
+
+    def run():
+        for i in range(n):
+            compile_statement(Item.table_name, Item.__primary_key__, 'insert', fields, 100)
+            compile_statement(Item.table_name, Item.__primary_key__, 'update', fields[1:])
+    return run, None
+
+
+def bench_select_statement(backend, n):
+    # expression compilation and the cached select template
+    query = Item.query(None)
+
+    def run():
+        for i in range(n):
+            query.filter(Item.price > i, Item.name.like('item%')).order_by('-uid').limit(10)._select_statement()
+    return run, None
+
+
+cases = {
+    name[len('bench_'):]: func for name, func in list(globals().items())
+    if name.startswith('bench_') and callable(func)
+}
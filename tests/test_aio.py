@@ -0,0 +1,112 @@
+import asyncio
+import unittest
+from PyORM.aio import AsyncPool, AsyncSession
+from PyORM.dialect import SQLiteDialect
+from PyORM.utils import execute_sql
+from tests.test_query import Author, Book, UnbufferedDialect
+
+
+class AsyncTest(unittest.TestCase):
+    def create_pool(self, dialect=None, **kwargs):
+        pool = AsyncPool(dialect=dialect or SQLiteDialect(), **kwargs)
+        self.addCleanup(pool.close)
+        with pool.pool.connection() as conn:
+            for cls in (Author, Book):
+                cls.create_table(conn)
+            conn.commit()
+        return pool
+
+    @staticmethod
+    def author(aid, **kwargs):
+        author = Author()
+        author.aid, author.name = aid, f'author-{aid}'
+        return author
+
+    async def insert_authors(self, session, n):
+        for i in range(n):
+            book = Book()
+            book.bid, book.author_id, book.title = i, i, f'book-{i}'
+            session.add([self.author(i), book])
+        await session.commit()
+        await session.close()
+
+    def test_pool_runs_functions_on_borrowed_connections(self):
+        pool = self.create_pool(maxsize=2)
+
+        async def main():
+            async with pool.connection() as conn:
+                return await pool.run(execute_sql, conn, 'SELECT 1')
+
+        self.assertEqual(asyncio.run(main()), ((1,),))
+        self.assertEqual(pool.pool.busy, 0)
+
+    def test_acquire_times_out_when_the_pool_is_exhausted(self):
+        pool = self.create_pool(maxsize=1, timeout=0.2)
+
+        async def main():
+            async with pool.connection():
+                with self.assertRaises(TimeoutError):
+                    await pool.acquire_conn()
+
+        asyncio.run(main())
+
+    def test_tasks_keep_their_own_queues(self):
+        pool = self.create_pool(maxsize=2)
+        session = AsyncSession(pool)
+
+        async def pending():
+            session.add(self.author(1))
+            await asyncio.sleep(0.05)
+            await session.close()
+
+        async def committed():
+            session.add(self.author(2))
+            await session.commit()
+            await session.close()
+
+        async def main():
+            await asyncio.gather(pending(), committed())
+            rows = await session.query(Author).as_tuples().all()
+            await session.close()
+            return rows
+
+        self.assertEqual(asyncio.run(main()), [(2, 'author-2')])
+        self.assertEqual(pool.pool.busy, 0)
+
+    def test_concurrent_streams_on_a_small_pool(self):
+        # each stream needs the task connection and a second one to read from
+        pool = self.create_pool(UnbufferedDialect(), maxsize=2, timeout=2)
+        session = AsyncSession(pool)
+
+        async def stream():
+            titles = list()
+            async for author in session.query(Author).load('books').iter(2):
+                titles.extend(book.title for book in author.books)
+            return titles
+
+        async def main():
+            await self.insert_authors(session, 4)
+            return await asyncio.gather(stream(), stream())
+
+        expected = [f'book-{i}' for i in range(4)]
+        self.assertEqual(asyncio.run(main()), [expected, expected])
+
+    def test_stream_on_a_single_connection_pool(self):
+        pool = self.create_pool(UnbufferedDialect(), maxsize=1, timeout=2)
+        session = AsyncSession(pool)
+
+        async def main():
+            await self.insert_authors(session, 3)
+            names = [author.name async for author in session.query(Author).iter(2)]
+            # the stream has the only connection, relationships can not be loaded while it is read
+            with self.assertRaises(RuntimeError):
+                async for _ in session.query(Author).load('books').iter(2):
+                    pass
+            await session.close()
+            return names
+
+        self.assertEqual(asyncio.run(main()), [f'author-{i}' for i in range(3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from PyORM import PyORM
+from PyORM.orm import Model
+from PyORM.fields import Integer, String, Double
+from PyORM.dialect import SQLiteDialect, encode_tsv, decode_tsv
+
+
+class Event(Model):
+    table_name = 'test_events'
+    eid = Integer(primary_key=True)
+    name = String(max_length=64)
+    score = Double()
+
+
+def event(**kwargs):
+    record = Event()
+    for k, v in kwargs.items():
+        setattr(record, k, v)
+    return record
+
+
+class TSVTest(unittest.TestCase):
+    def test_round_trip(self):
+        values = ['tab\there', 'line\nbreak', 'back\\slash', 'carriage\rreturn', '\\N', '', None, 'nul\0']
+        line = encode_tsv(values)
+        self.assertTrue(line.endswith('\n'))
+        self.assertEqual(line.count('\t'), len(values) - 1)
+        self.assertEqual(line.count('\n'), 1)
+        self.assertEqual(decode_tsv(line), values)
+
+    def test_scalars(self):
+        line = encode_tsv([1, 2.5, True, False, None])
+        self.assertEqual(line, '1\t2.5\t1\t0\t\\N\n')
+        self.assertEqual(decode_tsv(line), ['1', '2.5', '1', '0', None])
+
+
+class BulkLoadTest(unittest.TestCase):
+    def setUp(self):
+        self.db = PyORM(dialect='sqlite')
+        self.addCleanup(self.db.close)
+        with self.db.engine() as conn:
+            Event.create_table(conn)
+            conn.commit()
+
+    def rows(self):
+        return Event.query(self.db.session).as_tuples().order_by('eid').all()
+
+    def test_bulk_load(self):
+        names = ['plain', 'with\ttab', 'with\nnewline', 'with\\backslash']
+        records = (event(eid=i, name=name, score=i / 2) for i, name in enumerate(names))
+        # a tiny chunk_bytes loads every record from its own file
+        result = self.db.session.bulk_load(Event, records, chunk_bytes=1)
+        self.assertEqual(result, (4, 0))
+        self.assertEqual(self.rows(), [(i, name, i / 2) for i, name in enumerate(names)])
+
+    def test_duplicates_are_warnings(self):
+        self.db.session.bulk_load(Event, [event(eid=1, name='first')])
+        result = self.db.session.bulk_load(Event, [event(eid=i, name=f'name {i}') for i in range(3)])
+        self.assertEqual(result.rows, 2)
+        self.assertEqual(result.warnings, 1)
+        self.assertEqual(self.rows(), [(0, 'name 0', None), (1, 'first', None), (2, 'name 2', None)])
+
+    def test_records_must_assign_the_same_fields(self):
+        with self.assertRaises(ValueError):
+            self.db.session.bulk_load(Event, [event(eid=1, name='a'), event(eid=2)])
+        # the load is rolled back
+        self.assertEqual(self.rows(), [])
+
+    def test_empty(self):
+        self.assertEqual(self.db.session.bulk_load(Event, []), (0, 0))
+
+
+class LoadFileTest(unittest.TestCase):
+    def test_load_file_counts_duplicates(self):
+        dialect = SQLiteDialect()
+        connection = dialect.connect()
+        self.addCleanup(connection.close)
+        cursor = connection.cursor()
+        cursor.execute('CREATE TABLE t (k INTEGER PRIMARY KEY, v TEXT UNIQUE);')
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', suffix='.tsv', delete=False) as f:
+            for row in [(1, 'a'), (2, 'b'), (1, 'c'), (3, 'a'), (4, None), (5, 'x\ty')]:
+                f.write(encode_tsv(row))
+        self.addCleanup(os.remove, f.name)
+        self.assertEqual(dialect.load_file(cursor, 't', ('k', 'v'), f.name, chunk_size=2), (4, 2))
+        cursor.execute('SELECT k, v FROM t ORDER BY k;')
+        self.assertEqual(cursor.fetchall(), ((1, 'a'), (2, 'b'), (4, None), (5, 'x\ty')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import array
+import unittest
+from PyORM import PyORM
+from PyORM.orm import Model
+from PyORM.fields import Integer, String, Double, Boolean
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Measure(Model):
+    table_name = 'test_measures'
+    mid = Integer(primary_key=True)
+    label = String(max_length=8)
+    value = Double()
+    level = Integer(minvalue=0, maxvalue=10)
+    valid = Boolean()
+
+
+class ColumnsTest(unittest.TestCase):
+    def setUp(self):
+        self.db = PyORM(dialect='sqlite')
+        self.addCleanup(self.db.close)
+        with self.db.engine() as conn:
+            Measure.create_table(conn)
+            conn.commit()
+
+    def rows(self):
+        return Measure.query(self.db.session).as_tuples().order_by('mid').all()
+
+    def test_bulk_create_inserts_columns(self):
+        count = Measure.bulk_create(self.db.session, columns={
+            'mid': array.array('q', [1, 2, 3]),
+            'label': ['a', 'b', 'c'],
+            'value': [0.5, 1, 2.5],
+            'level': [0, 10, None],
+        })
+        self.assertEqual(count, 3)
+        self.assertEqual(self.rows(), [(1, 'a', 0.5, 0, None), (2, 'b', 1.0, 10, None), (3, 'c', 2.5, None, None)])
+
+    def test_bulk_create_on_a_connection(self):
+        with self.db.engine() as conn:
+            count = Measure.bulk_create(conn, columns={'mid': range(5), 'level': [1] * 5}, max_batch_rows=2)
+        self.assertEqual(count, 5)
+        self.assertEqual(len(self.rows()), 5)
+
+    def test_bulk_create_rejects_invalid_columns(self):
+        session = self.db.session
+        with self.assertRaises(ValueError):
+            Measure.bulk_create(session, columns={'mid': [1, 2], 'level': [1, 11]})
+        with self.assertRaises(ValueError):
+            Measure.bulk_create(session, columns={'mid': [1, 2], 'label': ['short', 'much too long']})
+        with self.assertRaises(ValueError):
+            Measure.bulk_create(session, columns={'mid': [1, 2], 'value': [1.0, 'x']})
+        with self.assertRaises(ValueError):
+            Measure.bulk_create(session, columns={'mid': [1, 2], 'level': [1]})
+        with self.assertRaises(AttributeError):
+            Measure.bulk_create(session, columns={'mid': [1], 'unknown': [1]})
+        # nothing is written when a column is invalid
+        self.assertEqual(self.rows(), [])
+
+    def test_to_columns(self):
+        Measure.bulk_create(self.db.session, columns={'mid': [1, 2, 3], 'label': ['a', 'b', 'c'], 'level': [3, 2, 1]})
+        query = Measure.query(self.db.session).only('mid', 'level').order_by('mid')
+        self.assertEqual(query.to_columns(chunk_size=2), {'mid': [1, 2, 3], 'level': [3, 2, 1]})
+        self.assertEqual(query.to_columns(label='b'), {'mid': [2], 'level': [2]})
+        self.assertEqual(query.to_columns(label='z'), {'mid': [], 'level': []})
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_to_numpy(self):
+        Measure.bulk_create(self.db.session, columns={
+            'mid': numpy.arange(1, 4),
+            'value': numpy.array([0.5, 1.5, 2.5]),
+            'level': [1, None, 3],
+            'valid': [True, False, True],
+        })
+        arrays = Measure.query(self.db.session).order_by('mid').to_numpy(chunk_size=2)
+        self.assertEqual(arrays['mid'].dtype, numpy.int64)
+        self.assertEqual(arrays['mid'].tolist(), [1, 2, 3])
+        self.assertEqual(arrays['value'].tolist(), [0.5, 1.5, 2.5])
+        # NULL turns an integer column into float64 with nan
+        self.assertEqual(arrays['level'].dtype, numpy.float64)
+        self.assertTrue(numpy.isnan(arrays['level'][1]))
+        self.assertEqual(arrays['valid'].dtype, numpy.bool_)
+        self.assertEqual(arrays['label'].dtype, object)
+        self.assertEqual(arrays['label'].tolist(), [None, None, None])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_to_numpy_without_rows(self):
+        arrays = Measure.query(self.db.session).to_numpy()
+        self.assertEqual(arrays['mid'].dtype, numpy.int64)
+        self.assertEqual(len(arrays['mid']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
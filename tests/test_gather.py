@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+from PyORM import PyORM
+from PyORM.query import Query
+from tests.test_query import Author
+
+
+class GatherTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        primary, replica = os.path.join(directory.name, 'primary.db'), os.path.join(directory.name, 'replica.db')
+        self.db = PyORM(database=primary, dialect='sqlite', replicas=[{'database': replica}])
+        for database in (primary, replica):
+            with PyORM(database=database, dialect='sqlite').engine() as conn:
+                Author.create_table(conn)
+                conn.commit()
+        self.session = self.db.session
+        self.addCleanup(self.db.replicas.close)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_gather_reads_its_own_writes(self):
+        author = Author()
+        author.aid, author.name = 1, 'a'
+        self.session.add(author)
+        self.session.commit()
+        # the replica has not caught up, the queries right after the commit have to read the primary
+        rows, selected = Query.gather(
+            Author.query(self.session).as_tuples(),
+            Author.query(self.session).as_tuples().select_all,
+        )
+        self.assertEqual(rows, [(1, 'a')])
+        self.assertEqual(selected, [(1, 'a')])
+
+    def test_gather_borrows_connections_from_a_pool(self):
+        results = Query.gather(*[Author.query(self.session).as_tuples() for _ in range(10)])
+        self.assertEqual(results, [[]] * 10)
+        pool = self.session.shared_pool
+        self.assertTrue(0 < pool.size <= pool.maxsize)
+        self.assertEqual(pool.busy, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
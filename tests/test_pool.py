@@ -0,0 +1,100 @@
+import time
+import unittest
+from PyORM.pool import Pool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise ConnectionError('gone away')
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class PoolTest(unittest.TestCase):
+    def create_pool(self, **kwargs):
+        self.created = list()
+
+        def creator():
+            conn = FakeConnection()
+            self.created.append(conn)
+            return conn
+
+        pool = Pool(creator=creator, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_acquire_times_out_when_every_connection_is_busy(self):
+        pool = self.create_pool(minsize=0, maxsize=1, timeout=0.1)
+        conn = pool.acquire_conn()
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            pool.acquire_conn()
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        pool.release_conn(conn)
+        self.assertIs(pool.acquire_conn(), conn)
+
+    def test_release_rolls_back_the_pending_transaction(self):
+        pool = self.create_pool(minsize=0, maxsize=1)
+        with pool.connection() as conn:
+            pass
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertEqual((pool.idle, pool.busy), (1, 0))
+
+    def test_release_of_a_foreign_connection_fails(self):
+        pool = self.create_pool(minsize=0)
+        with self.assertRaises(RuntimeError):
+            pool.release_conn(FakeConnection())
+
+    def test_dead_connection_is_replaced_on_checkout(self):
+        pool = self.create_pool(minsize=0, maxsize=1)
+        with pool.connection() as conn:
+            pass
+        conn.alive = False
+        with pool.connection() as replaced:
+            self.assertIsNot(replaced, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.size, 1)
+
+    def test_expired_connection_is_replaced_on_checkout(self):
+        pool = self.create_pool(minsize=0, maxsize=1, max_lifetime=0.05)
+        with pool.connection() as conn:
+            pass
+        time.sleep(0.1)
+        with pool.connection() as replaced:
+            self.assertIsNot(replaced, conn)
+
+    def test_watchdog_evicts_idle_connections_above_minsize(self):
+        pool = self.create_pool(minsize=1, maxsize=3, interval=0.02, max_idle=0.05)
+        connections = [pool.acquire_conn() for _ in range(3)]
+        for conn in connections:
+            pool.release_conn(conn)
+        deadline = time.monotonic() + 2
+        while pool.size > 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual((pool.size, pool.idle), (1, 1))
+        self.assertEqual(sum(conn.closed for conn in connections), 2)
+
+    def test_close_closes_idle_connections(self):
+        pool = self.create_pool(minsize=2, maxsize=2)
+        pool.warmup()
+        pool.close()
+        self.assertTrue(all(conn.closed for conn in self.created))
+        with self.assertRaises(RuntimeError):
+            pool.acquire_conn()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import tempfile
+import unittest
+import warnings
+from PyORM import PyORM, utils
+from PyORM.query import Query, FullScanWarning
+from PyORM.orm import Model
+from PyORM.fields import Integer, String, ForeignKey
+from PyORM.relationship import Relationship
+from PyORM.dialect import SQLiteDialect
+from PyORM.cache import ResultCache
+
+
+class Author(Model):
+    table_name = 'test_authors'
+    aid = Integer(primary_key=True)
+    name = String(max_length=20)
+    books = Relationship('Book', 'author_id')
+
+
+class Book(Model):
+    table_name = 'test_books'
+    bid = Integer(primary_key=True)
+    author_id = ForeignKey(Author.aid)
+    title = String(max_length=20)
+    summary = String(max_length=200, deferred=True)
+
+
+class UnbufferedDialect(SQLiteDialect):
+    # streams like mysql's SSCursor: the connection can not run other statements until the stream ends
+    buffered_stream = False
+
+
+class StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.db = PyORM(dialect=UnbufferedDialect())
+        self.session = self.db.session
+        with self.db.engine() as conn:
+            for cls in (Author, Book):
+                cls.create_table(conn)
+            conn.commit()
+        records = list()
+        for i in range(5):
+            author, book = Author(), Book()
+            author.aid, author.name = i, f'author-{i}'
+            book.bid, book.author_id, book.title, book.summary = i, i, f'book-{i}', f'summary-{i}'
+            records.extend((author, book))
+        self.session.add(records)
+        self.session.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_stream_loads_relationships_on_another_connection(self):
+        titles = list()
+        for author in Author.query(self.session).load('books').iter(chunk_size=2):
+            # the relationships of the next chunk are loaded while the stream is still open
+            self.assertNotIn(id(self.session.connection), utils._streaming)
+            titles.extend(book.title for book in author.books)
+        self.assertEqual(titles, [f'book-{i}' for i in range(5)])
+
+    def test_stream_on_a_connection_rejects_loads(self):
+        with self.db.engine() as conn:
+            with self.assertRaises(RuntimeError):
+                list(Author.query(conn).load('books').iter(chunk_size=2))
+            # the connection is usable again once the stream is closed
+            self.assertEqual(len(Author.query(conn).all()), 5)
+
+    def test_stream_loads_deferred_fields_on_another_connection(self):
+        summaries = list()
+        for book in Book.query(self.session).iter(chunk_size=2):
+            summaries.append(book.summary)
+        self.assertEqual(summaries, [f'summary-{i}' for i in range(5)])
+
+    def test_stream_on_a_connection_rejects_deferred_loads(self):
+        with self.db.engine() as conn:
+            with self.assertRaises(RuntimeError):
+                for book in Book.query(conn).iter(chunk_size=2):
+                    book.summary
+            self.assertEqual([book.summary for book in Book.query(conn).undefer('summary').iter(chunk_size=2)],
+                             [f'summary-{i}' for i in range(5)])
+
+
+class SQLiteStreamTest(unittest.TestCase):
+    def check_commit_inside_stream(self, database):
+        db = PyORM(database=database, dialect='sqlite')
+        self.addCleanup(db.close)
+        with db.engine() as conn:
+            Author.create_table(conn)
+            conn.commit()
+        for i in range(4):
+            author = Author()
+            author.aid, author.name = i, f'author-{i}'
+            db.session.add(author)
+        db.session.commit()
+        # sqlite cursors do not disturb each other, the stream stays on the context connection
+        for author in Author.query(db.session).iter(chunk_size=2):
+            author.name = author.name.upper()
+            db.session.add(author)
+            db.session.commit()
+        self.assertEqual([name for _, name in Author.query(db.session).as_tuples().order_by('aid').all()],
+                         [f'AUTHOR-{i}' for i in range(4)])
+
+    def test_commit_inside_stream_in_memory(self):
+        self.check_commit_inside_stream('')
+
+    def test_commit_inside_stream_on_a_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.check_commit_inside_stream(os.path.join(directory.name, 'stream.db'))
+
+
+class FullScanTest(unittest.TestCase):
+    def test_check_full_scan_is_per_session(self):
+        checked, unchecked = PyORM(dialect='sqlite', check_full_scan=True), PyORM(dialect='sqlite')
+        for db in (checked, unchecked):
+            with db.engine() as conn:
+                Author.create_table(conn)
+                conn.commit()
+        self.assertFalse(Query.check_full_scan)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            Author.query(unchecked.session).filter_by(name='b')
+            self.assertEqual(caught, [])
+            Author.query(checked.session).filter_by(name='a')
+            self.assertEqual([each.category for each in caught], [FullScanWarning])
+        checked.close()
+        unchecked.close()
+
+
+class CacheTest(unittest.TestCase):
+    def test_cached_rows_are_kept_apart_per_database(self):
+        store = ResultCache()
+        sessions = list()
+        for tenant in ('tenant-a', 'tenant-b'):
+            db = PyORM(dialect='sqlite')
+            self.addCleanup(db.close)
+            with db.engine() as conn:
+                Author.create_table(conn)
+                conn.commit()
+            author = Author()
+            author.aid, author.name = 1, tenant
+            db.session.add(author)
+            db.session.commit()
+            sessions.append(db.session)
+        # the same statement on two databases
+        names = [Author.query(session).cache(store=store).as_tuples().all() for session in sessions]
+        self.assertEqual(names, [[(1, 'tenant-a')], [(1, 'tenant-b')]])
+
+if __name__ == '__main__':
+    unittest.main()
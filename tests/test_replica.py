@@ -0,0 +1,108 @@
+import os
+import tempfile
+import time
+import unittest
+from PyORM import PyORM
+from PyORM.pool import Pool
+from tests.test_query import Author
+
+
+class ReplicaTest(unittest.TestCase):
+    replicas = 2
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.primary = os.path.join(directory.name, 'primary.db')
+        self.replica_files = [os.path.join(directory.name, f'replica-{i}.db') for i in range(self.replicas)]
+        # every database holds one author named after it, a query tells which database it read
+        for i, database in enumerate([self.primary] + self.replica_files):
+            with PyORM(database=database, dialect='sqlite').engine() as conn:
+                Author.create_table(conn)
+                conn.cursor().execute(
+                    f'INSERT INTO {Author.table_name}(aid, name) VALUES (%s, %s);', (0, 'primary' if i == 0 else f'replica-{i - 1}'))
+                conn.commit()
+
+    def connect(self, **kwargs):
+        db = PyORM(database=self.primary, dialect='sqlite', replicas=[{'database': f} for f in self.replica_files], **kwargs)
+        self.addCleanup(db.replicas.close)
+        self.addCleanup(db.close)
+        return db
+
+    @staticmethod
+    def name(session, aid=0):
+        rows = Author.query(session).as_tuples().filter_by(aid=aid)
+        return rows[0][1] if rows else None
+
+    def read(self, session):
+        # every read is a new context, the replica connection of the previous one is returned
+        try:
+            return self.name(session)
+        finally:
+            session.close()
+
+    @staticmethod
+    def author(aid, name):
+        author = Author()
+        author.aid, author.name = aid, name
+        return author
+
+    def test_round_robin(self):
+        session = self.connect().session
+        self.assertEqual([self.read(session) for _ in range(4)], ['replica-0', 'replica-1', 'replica-0', 'replica-1'])
+
+    def test_least_busy(self):
+        db = self.connect(replica_policy='least_busy')
+        pool = db.replicas.pools[0]
+        connect = pool.acquire_conn()
+        # replica-0 lends a connection, every read goes to replica-1
+        self.assertEqual([self.read(db.session) for _ in range(3)], ['replica-1'] * 3)
+        pool.release_conn(connect)
+        self.assertEqual({self.read(db.session) for _ in range(4)}, {'replica-0', 'replica-1'})
+
+    def test_context_keeps_its_replica(self):
+        session = self.connect().session
+        names = [self.name(session) for _ in range(3)]
+        session.close()
+        self.assertEqual(names, ['replica-0'] * 3)
+
+    def test_unavailable_replica_is_skipped(self):
+        broken = Pool(database=self.replica_files[0], minsize=0, maxsize=1, timeout=0.1, dialect='sqlite')
+        self.addCleanup(broken.close)
+        held = broken.acquire_conn()
+        self.addCleanup(broken.release_conn, held)
+        db = PyORM(database=self.primary, dialect='sqlite', replicas=[broken, {'database': self.replica_files[1]}])
+        self.addCleanup(db.replicas.close)
+        self.addCleanup(db.close)
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual([self.read(db.session) for _ in range(2)], ['replica-1'] * 2)
+
+    def test_writes_go_to_the_primary(self):
+        session = self.connect(sticky_seconds=0).session
+        session.add(self.author(1, 'new'))
+        session.commit()
+        session.close()
+        with PyORM(database=self.primary, dialect='sqlite').engine() as conn:
+            self.assertEqual(len(Author.query(conn).all()), 2)
+        for database in self.replica_files:
+            with PyORM(database=database, dialect='sqlite').engine() as conn:
+                self.assertEqual(len(Author.query(conn).all()), 1)
+        # without sticky reads the replicas, which have not caught up
+        self.assertIsNone(self.name(session, 1))
+        session.close()
+
+    def test_sticky_reads_after_commit(self):
+        session = self.connect(sticky_seconds=0.2).session
+        self.assertEqual(self.read(session), 'replica-0')
+        session.add(self.author(1, 'new'))
+        session.commit()
+        # the context reads its own write from the primary
+        self.assertEqual(self.name(session, 1), 'new')
+        self.assertEqual(self.name(session), 'primary')
+        time.sleep(0.3)
+        self.assertEqual(self.name(session), 'replica-1')
+        session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
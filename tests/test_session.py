@@ -0,0 +1,112 @@
+import unittest
+from PyORM import PyORM
+from PyORM.orm import Model
+from PyORM.fields import Integer, String, Boolean, ForeignKey
+
+
+class Account(Model):
+    table_name = 'test_accounts'
+    uid = Integer(primary_key=True)
+    name = String(max_length=20)
+    active = Boolean(default=True)
+
+
+class Note(Model):
+    table_name = 'test_notes'
+    nid = Integer(primary_key=True, auto_increment=True)
+    text = String(max_length=20)
+
+
+class Parent(Model):
+    table_name = 'test_parents'
+    pid = Integer(primary_key=True)
+    name = String(max_length=20)
+
+
+class Child(Model):
+    table_name = 'test_children'
+    cid = Integer(primary_key=True)
+    parent_id = ForeignKey(Parent.pid)
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        self.db = PyORM(dialect='sqlite')
+        self.session = self.db.session
+        with self.db.engine() as conn:
+            for cls in (Account, Note, Parent, Child):
+                cls.create_table(conn)
+            conn.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    @staticmethod
+    def create(cls, **kwargs):
+        record = cls()
+        for k, v in kwargs.items():
+            setattr(record, k, v)
+        return record
+
+    def account(self, uid, **kwargs):
+        return self.create(Account, uid=uid, **kwargs)
+
+    def test_add_inserted_record_again_updates_it(self):
+        record = self.account(1, name='a', active=False)
+        self.session.add(record)
+        self.session.commit()
+        found = Account.query(self.session).get(1)
+        self.assertIs(found, record)
+        found.name = 'b'
+        self.session.add(found)
+        self.session.commit()
+        self.assertEqual(Account.query(self.session).as_tuples().all(), [(1, 'b', False)])
+
+    def test_database_default_is_read_back(self):
+        record = self.account(1, name='a')
+        self.session.add(record)
+        self.session.commit()
+        self.assertEqual(Account.query(self.session).get(1).active, True)
+        self.assertEqual([each.active for each in Account.query(self.session).all()], [True])
+
+    def test_flush_keeps_the_order_across_models(self):
+        # the second parent assigns other fields than the first one, it must not be inserted after the children
+        self.session.add([
+            self.create(Parent, pid=1, name='a'),
+            self.create(Child, cid=1, parent_id=1),
+            self.create(Parent, pid=2),
+            self.create(Child, cid=2, parent_id=2),
+        ])
+        self.session.commit()
+        self.assertEqual(Child.query(self.session).as_tuples().order_by('cid').all(), [(1, 1), (2, 2)])
+
+    def test_flush_merges_adjacent_records_only(self):
+        queue = [('insert', self.create(Parent, pid=i, name=str(i))) for i in range(3)]
+        queue.append(('insert', self.create(Child, cid=1, parent_id=1)))
+        queue.append(('insert', self.create(Parent, pid=3, name='3')))
+        statements = list(self.session._flush_statements(queue))
+        self.assertEqual([len(values) for _, values, _ in statements], [6, 2, 2])
+
+    def test_single_insert_reads_back_the_generated_key(self):
+        note = self.create(Note, nid=None, text='a')
+        self.session.add(note)
+        self.session.commit()
+        self.assertEqual(note.nid, 1)
+        note.text = 'b'
+        self.session.add(note)
+        self.session.commit()
+        self.assertEqual(Note.query(self.session).as_tuples().all(), [(1, 'b')])
+
+    def test_multi_row_insert_without_keys_inserts_again(self):
+        notes = [self.create(Note, text=str(i)) for i in range(2)]
+        self.session.add(notes)
+        self.session.commit()
+        # the generated keys of a multi-row INSERT are not read back
+        self.assertFalse(notes[0].read_from_db)
+        self.session.add(notes[0])
+        self.session.commit()
+        self.assertEqual(Note.query(self.session).as_tuples().order_by('nid').all(), [(1, '0'), (2, '1'), (3, '0')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from PyORM import PyORM
+from PyORM.orm import Model
+from PyORM.fields import Integer, String
+from PyORM.shard import HashShardMap, RangeShardMap
+
+
+class Customer(Model):
+    table_name = 'test_customers'
+    cid = Integer(primary_key=True)
+    name = String(max_length=20)
+
+
+class Order(Model, shard_key='user_id', shard_map=HashShardMap(2)):
+    table_name = 'test_orders'
+    oid = Integer(primary_key=True)
+    user_id = Integer()
+    amount = Integer()
+
+
+class Visit(Model, shard_key='day', shard_map=RangeShardMap([10])):
+    table_name = 'test_visits'
+    vid = Integer(primary_key=True)
+    day = Integer()
+
+
+class ShardTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.primary = os.path.join(directory.name, 'primary.db')
+        self.shard_files = [os.path.join(directory.name, f'shard-{i}.db') for i in range(2)]
+        self.db = PyORM(database=self.primary, dialect='sqlite', shards=[{'database': f} for f in self.shard_files])
+        self.addCleanup(self.db.shards.close)
+        self.addCleanup(self.db.close)
+        self.db.create_all()
+        self.session = self.db.session
+
+    @staticmethod
+    def fetch(database, sql):
+        connection = sqlite3.connect(database)
+        try:
+            return connection.execute(sql).fetchall()
+        finally:
+            connection.close()
+
+    def tables(self, database):
+        return {row[0] for row in self.fetch(database, "SELECT name FROM sqlite_master WHERE type = 'table';")}
+
+    @staticmethod
+    def create(cls, **kwargs):
+        record = cls()
+        for k, v in kwargs.items():
+            setattr(record, k, v)
+        return record
+
+    def add_orders(self, n=10):
+        # amount runs backwards, the order by amount differs from the order by oid in each shard
+        for oid in range(n):
+            self.session.add(self.create(Order, oid=oid, user_id=oid % 5, amount=(n - oid) * 10))
+        self.session.commit()
+
+    def test_create_all_placement(self):
+        self.assertIn(Customer.table_name, self.tables(self.primary))
+        self.assertNotIn(Order.table_name, self.tables(self.primary))
+        for database in self.shard_files:
+            self.assertIn(Order.table_name, self.tables(database))
+            self.assertIn(Visit.table_name, self.tables(database))
+            self.assertNotIn(Customer.table_name, self.tables(database))
+
+    def test_commit_routes_by_shard_key(self):
+        self.session.add(self.create(Customer, cid=1, name='a'))
+        self.add_orders()
+        for visit in range(0, 20, 5):
+            self.session.add(self.create(Visit, vid=visit, day=visit))
+        self.session.commit()
+        self.assertEqual(self.fetch(self.primary, f'SELECT cid FROM {Customer.table_name};'), [(1,)])
+        for shard, database in enumerate(self.shard_files):
+            user_ids = self.fetch(database, f'SELECT user_id FROM {Order.table_name};')
+            self.assertTrue(user_ids)
+            self.assertEqual({user_id % 2 for user_id, in user_ids}, {shard})
+        self.assertEqual(self.fetch(self.shard_files[0], f'SELECT vid FROM {Visit.table_name} ORDER BY vid;'), [(0,), (5,)])
+        self.assertEqual(self.fetch(self.shard_files[1], f'SELECT vid FROM {Visit.table_name} ORDER BY vid;'), [(10,), (15,)])
+
+    def test_update_and_delete_go_to_the_shard(self):
+        self.add_orders()
+        order = Order.query(self.session).get(3)
+        order.amount = 1
+        self.session.add(order)
+        self.session.remove(Order.query(self.session).get(4))
+        self.session.commit()
+        self.assertEqual(self.fetch(self.shard_files[1], f'SELECT amount FROM {Order.table_name} WHERE oid = 3;'), [(1,)])
+        self.assertEqual(self.fetch(self.shard_files[0], f'SELECT oid FROM {Order.table_name} WHERE oid = 4;'), [])
+
+    def test_shard_key_condition_reads_one_shard(self):
+        self.add_orders()
+        query = Order.query(self.session).as_tuples().filter(Order.user_id == 3)
+        self.assertEqual(query._shards(), [1])
+        self.assertEqual(sorted(row[0] for row in query.all()), [3, 8])
+        self.assertEqual(Order.query(self.session).filter(Order.user_id.in_([0, 2]))._shards(), [0])
+        self.assertEqual(Order.query(self.session)._shards(), [0, 1])
+
+    def test_fan_out_merges_order_limit_offset(self):
+        self.add_orders()
+        expected = [(oid, oid % 5, (10 - oid) * 10) for oid in range(10)]
+        query = Order.query(self.session).as_tuples()
+        self.assertEqual(sorted(query.all()), expected)
+        by_amount = sorted(expected, key=lambda row: row[2])
+        ordered = query.order_by('amount')
+        self.assertEqual(ordered.all(), by_amount)
+        self.assertEqual(ordered.limit(3).all(), by_amount[:3])
+        self.assertEqual(ordered.offset(2).limit(3).all(), by_amount[2:5])
+        self.assertEqual(ordered.offset(8).all(), by_amount[8:])
+        self.assertEqual(query.order_by('-amount').limit(2).all(), by_amount[::-1][:2])
+
+    def test_fan_out_stream_merges_shards(self):
+        self.add_orders()
+        by_amount = sorted(range(10), key=lambda oid: 10 - oid)
+        rows = [row[0] for row in Order.query(self.session).as_tuples().order_by('amount').offset(1).limit(6).iter(chunk_size=2)]
+        self.assertEqual(rows, by_amount[1:7])
+        self.assertEqual(sorted(order.oid for order in Order.query(self.session).iter(chunk_size=3)), list(range(10)))
+
+    def test_order_by_unselected_field_fails(self):
+        self.add_orders()
+        with self.assertRaises(RuntimeError):
+            Order.query(self.session).only('oid').order_by('amount').all()
+
+
+if __name__ == '__main__':
+    unittest.main()